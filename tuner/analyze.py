@@ -0,0 +1,267 @@
+"""
+Offline pitch analysis of WAV files, without the GUI.
+
+Every file is analysed in its own worker process, and a per-frame pitch
+track is written next to it (or under ``--output-dir``)::
+
+    python analyze.py recordings/ take1.wav --detector yin --format csv
+
+With ``--cache`` the tracks are also kept in a ``trackcache.TrackCache``,
+so analysing the same recordings again only costs reading them.
+"""
+
+__author__ = 'Vedant Mehta'
+
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import trackcache
+import tunertools
+
+FORMATS = ('csv', 'jsonl', 'npy')
+COLUMNS = ('time', 'f0', 'harmonic_rate', 'note', 'cents')
+TABLE_DTYPE = [('time', 'f8'), ('f0', 'f8'), ('harmonic_rate', 'f8'),
+               ('note', 'U7'), ('cents', 'f8')]
+
+
+def find_wavs(paths):
+    """
+    WAV files named by ``paths``, searching directories recursively
+
+    Parameters
+    ----------
+    paths : iterable of str
+        files and directories
+
+    Returns ``(path, name)`` pairs, where ``name`` is the path relative
+    to the directory it was found in (just the file name for files).
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for f in sorted(files):
+                    if f.lower().endswith('.wav'):
+                        full = os.path.join(root, f)
+                        found.append((full, os.path.relpath(full, path)))
+        else:
+            found.append((path, os.path.basename(path)))
+    return found
+
+
+def read_mono(path):
+    """samplerate and float32 mono signal in [-1, 1] of a WAV file"""
+    sr, sig = tunertools.audio_read(path)
+    sig = tunertools.pcm_to_float(sig)
+    if sig.ndim > 1:
+        sig = sig.mean(axis=1)
+    return sr, sig.astype(np.float32, copy=False)
+
+
+def track_table(track):
+    """
+    per-frame rows of a ``tunertools.PitchTrack`` with note names
+
+    Returns a structured array with the fields in ``COLUMNS``.
+    """
+    labels, targets, cents = tunertools.nearest_note(track.pitches)
+    table = np.zeros(len(track.pitches), dtype=TABLE_DTYPE)
+    table['time'] = track.times
+    table['f0'] = track.pitches
+    table['harmonic_rate'] = track.harmonic_rates
+    table['note'] = labels
+    table['cents'] = cents
+    return table
+
+
+class TrackWriter:
+    """
+    Writes ``track_table`` rows to a csv, jsonl or npy file, possibly in
+    several pieces. Unvoiced frames have an empty note and, in csv/jsonl,
+    empty/null cents.
+    """
+
+    def __init__(self, path, fmt, n_rows=None):
+        """__init__.
+
+        Parameters
+        ----------
+        path : str
+            output file
+        fmt : str
+            one of ``FORMATS``
+        n_rows : int
+            total number of rows, required up front for npy so the file
+            can be memory-mapped and filled piece by piece
+        """
+        self.fmt = fmt
+        self.row = 0
+        if fmt == 'npy':
+            self.out = np.lib.format.open_memmap(
+                path, mode='w+', dtype=TABLE_DTYPE, shape=(n_rows,))
+            return
+        self.out = open(path, 'w', newline='')
+        if fmt == 'csv':
+            self.writer = csv.writer(self.out)
+            self.writer.writerow(COLUMNS)
+
+    def write(self, table):
+        """write.
+
+        Parameters
+        ----------
+        table : np.ndarray
+            rows from ``track_table``
+        """
+        if self.fmt == 'npy':
+            self.out[self.row:self.row + len(table)] = table
+        elif self.fmt == 'csv':
+            for row in table.tolist():
+                self.writer.writerow(['' if isinstance(v, float) and
+                                      np.isnan(v) else v for v in row])
+        else:
+            for row in table.tolist():
+                self.out.write(json.dumps(
+                    {k: None if isinstance(v, float) and np.isnan(v) else v
+                     for k, v in zip(COLUMNS, row)}) + '\n')
+        self.row += len(table)
+
+    def close(self):
+        """close.
+        Flush and close the file
+        """
+        if self.fmt == 'npy':
+            self.out.flush()
+            del self.out
+        else:
+            self.out.close()
+
+
+def output_path(name, path, output_dir, fmt):
+    """where the track of ``path`` (found as ``name``) is written"""
+    stem = os.path.splitext(name if output_dir else path)[0]
+    out = os.path.join(output_dir, stem) if output_dir else stem
+    return out + '.pitch.' + fmt
+
+
+def analyse_file(path, name, detector='yin', params=None, output_dir=None,
+                 fmt='csv', chunk=None, cache_dir=None):
+    """
+    run one detector over one file and write its pitch track
+
+    Parameters
+    ----------
+    path : str
+        WAV file
+    name : str
+        relative name used under ``output_dir``
+    detector : str
+        name in ``tunertools.DETECTORS``
+    params : dict
+        keyword arguments for the detector
+    output_dir : str
+        directory for the tracks; None writes next to the input
+    fmt : str
+        one of ``FORMATS``
+    chunk : int
+        stream the memory-mapped file through ``tunertools.stream_file``
+        in chunks of this many samples (YIN only), so memory does not
+        grow with the length of the recording
+    cache_dir : str
+        directory of a ``trackcache.TrackCache`` to look the track up in
+        and store it to; None always runs the detector. Not used with
+        ``chunk``
+
+    Returns a small summary dict. Runs in a worker process.
+    """
+    out = output_path(name, path, output_dir, fmt)
+    if os.path.dirname(out):
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+    params = params or {}
+    if chunk:
+        if detector != 'yin':
+            raise ValueError('chunked analysis is only available for yin')
+        sr, sig = tunertools.audio_read(path, mmap=True)
+        seconds = len(sig) / float(sr)
+        q, _, wl, ws = tunertools.decimated_params(
+            sr, params.get('target_sr'), params.get('wl', 882),
+            params.get('ws', 441))
+        n_rows = max(0, (-(-len(sig) // q) - wl) // ws + 1)
+        del sig
+        tracks = tunertools.stream_file(path, chunk, **params)
+    else:
+        sr, sig = read_mono(path)
+        seconds = len(sig) / float(sr)
+        if cache_dir is not None:
+            cache = trackcache.shared(cache_dir)
+            tracks = [cache.compute(detector, sig, sr, **params)]
+        else:
+            tracks = [tunertools.get_detector(detector)(sig, sr, **params)]
+        n_rows = len(tracks[0].pitches)
+    writer = TrackWriter(out, fmt, n_rows)
+    frames = voiced = 0
+    try:
+        for track in tracks:
+            writer.write(track_table(track))
+            frames += len(track.pitches)
+            voiced += int((np.asarray(track.pitches) > 0).sum())
+    finally:
+        writer.close()
+    return {'input': path, 'output': out, 'frames': frames,
+            'seconds': seconds,
+            'voiced': voiced / float(frames) if frames else 0.0}
+
+
+def main(argv=None):
+    """Parse arguments and analyse every file with a process pool"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('paths', nargs='+', help='WAV files or directories')
+    parser.add_argument('--detector', default='yin',
+                        choices=sorted(tunertools.DETECTORS))
+    parser.add_argument('--params', type=json.loads, default=None,
+                        help='JSON object of detector keyword arguments')
+    parser.add_argument('--format', default='csv', choices=FORMATS)
+    parser.add_argument('--output-dir', help='write tracks here instead of '
+                        'next to the inputs, keeping relative paths')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='worker processes (default: all cores)')
+    parser.add_argument('--chunk', type=int, default=None,
+                        help='stream each file in chunks of this many '
+                        'samples to keep memory bounded (yin only)')
+    parser.add_argument('--cache', action='store_true',
+                        help='reuse tracks of unchanged files from the '
+                        'track cache (PYTUNER_CACHE or the user cache '
+                        'directory)')
+    parser.add_argument('--cache-dir', help='track cache directory, '
+                        'implies --cache')
+    args = parser.parse_args(argv)
+
+    if args.chunk and args.detector != 'yin':
+        parser.error('--chunk is only available with --detector yin')
+    cache_dir = args.cache_dir or \
+        (trackcache.default_directory() if args.cache else None)
+    files = find_wavs(args.paths)
+    if not files:
+        parser.error('no WAV files found')
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(analyse_file, path, name, args.detector,
+                               args.params, args.output_dir, args.format,
+                               args.chunk, cache_dir):
+                   path for path, name in files}
+        for future in as_completed(futures):
+            try:
+                print(json.dumps(future.result()))
+            except Exception as e:
+                failed += 1
+                print('%s: %s' % (futures[future], e), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1118 @@
+"""
+Headless benchmarks for the pitch detection code in ``tunertools``.
+
+Runs without Tk or audio devices and prints JSON, e.g.::
+
+    python benchmark.py detectors --detectors yin acf --output report.json
+    python benchmark.py strum --trials 50
+    python benchmark.py alloc --blocksize 4096
+    python benchmark.py incremental --hops 64 441
+    python benchmark.py decimation --targets 11025
+    python benchmark.py pipeline --source file:GuitarNotes/A2.wav
+    python benchmark.py startup
+    python benchmark.py gate --silence 2
+    python benchmark.py smoothing --ws 128
+    python benchmark.py channels --channels 1 2 4 8
+    python benchmark.py cache --detectors yin yaapt
+    python benchmark.py fft --workers 1 4
+    python benchmark.py nccf --targets 11025
+"""
+
+__author__ = 'Vedant Mehta'
+
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import time
+import tracemalloc
+import numpy as np
+import trackcache
+import tunertools
+from pipeline import AnalysisPipeline, ChannelPool, ChannelTracker
+
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      'GuitarNotes')
+
+# MIDI numbers of the open strings used in the GuitarNotes file names
+OPEN_STRINGS = {'Elo': 40, 'A': 45, 'D': 50, 'G': 55, 'B': 59, 'Ehi': 64}
+# the "(ScaleN)" files are an A natural minor scale starting on A2
+SCALE_STEPS = (0, 2, 3, 5, 7, 8, 10, 12)
+
+
+def midi_to_hz(midi):
+    """equal tempered frequency of a MIDI note number, A4 = 440 Hz"""
+    return 440.0 * 2.0 ** ((midi - 69) / 12.0)
+
+
+def cents(f, ref):
+    """distance in cents from ``ref`` to ``f``"""
+    return 1200.0 * np.log2(np.asarray(f, np.float64) / ref)
+
+
+def note_from_filename(path):
+    """
+    target frequency of a GuitarNotes recording
+
+    Parameters
+    ----------
+    path : str
+        path to a file such as ``Elo3.wav`` (low E string, third fret) or
+        ``(Scale2) Re.wav``
+
+    Returns None when the name does not identify a note.
+    """
+    name = os.path.basename(path)
+    m = re.match(r'(Elo|Ehi|A|D|G|B)(\d+)\.wav$', name)
+    if m:
+        return midi_to_hz(OPEN_STRINGS[m.group(1)] + int(m.group(2)))
+    m = re.match(r'\(Scale(\d)\)', name)
+    if m and 1 <= int(m.group(1)) <= len(SCALE_STEPS):
+        return midi_to_hz(45 + SCALE_STEPS[int(m.group(1)) - 1])
+    return None
+
+
+def load_corpus(directory=CORPUS):
+    """
+    every WAV in ``directory`` as ``(name, sr, signal, target)``
+
+    Signals are scaled to float32 in [-1, 1]; ``target`` is the frequency
+    given by the file name, or None.
+    """
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith('.wav'):
+            continue
+        sr, sig = tunertools.audio_read(os.path.join(directory, name))
+        sig = tunertools.pcm_to_float(sig)
+        if sig.ndim > 1:
+            sig = sig.mean(axis=1)
+        corpus.append((name, sr, sig.astype(np.float32, copy=False),
+                       note_from_filename(name)))
+    return corpus
+
+
+def synthetic_corpus(seconds=(1.0,), sr=44100, harmonics=6, noise=0.01):
+    """
+    harmonic tones at the six open strings for each length in ``seconds``,
+    as ``(name, sr, signal, target)``
+    """
+    return [('synthetic %s %gs' % (label, length), sr,
+             tunertools.synthetic_note(midi_to_hz(midi), sr, length,
+                                       harmonics, noise),
+             midi_to_hz(midi))
+            for length in seconds
+            for label, midi in zip(('E2', 'A2', 'D3', 'G3', 'B3', 'E4'),
+                                   sorted(OPEN_STRINGS.values()))]
+
+
+def _percentiles(values):
+    values = np.asarray(values)
+    return {'p50': float(np.percentile(values, 50)),
+            'p90': float(np.percentile(values, 90)),
+            'p99': float(np.percentile(values, 99)),
+            'max': float(values.max())}
+
+
+def benchmark_detector(name, signals, repeats=3, params=None):
+    """
+    speed, memory and accuracy of one registered detector
+
+    Parameters
+    ----------
+    name : str
+        name in ``tunertools.DETECTORS``
+    signals : list
+        ``(name, sr, signal, target)`` tuples, see ``load_corpus``
+    repeats : int
+        timed calls per signal
+    params : dict
+        keyword arguments for the detector
+
+    Pitch errors are in cents against the target of each signal, using
+    the median of the voiced frames (``median_cents``) and
+    ``tunertools.avg_pitch`` (``avg_pitch_cents``). ``note_accuracy`` is
+    the share of signals where ``tunertools.quantize`` of the average
+    lands on the target note.
+    """
+    detector = tunertools.get_detector(name)
+    params = params or {}
+    notes = [f for label, f in tunertools.notes()]
+    latencies, frames, peaks, helpers = [], 0, [], []
+    median_err, avg_err, hits, voiced, per_signal = [], [], [], [], {}
+    for label, sr, sig, target in signals:
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            track = detector(sig, sr, **params)
+            latencies.append(time.perf_counter() - t0)
+            frames += len(track.pitches)
+        tracemalloc.start()
+        detector(sig, sr, **params)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        pitches = np.asarray(track.pitches)
+        voiced.append(float((pitches > 0).mean()) if len(pitches) else 0.0)
+        if target is None:
+            continue
+        result = {'target_hz': target, 'voiced': voiced[-1]}
+        if (pitches > 0).any():
+            t0 = time.perf_counter()
+            avg = tunertools.avg_pitch(pitches)
+            note = tunertools.quantize(avg, notes)
+            helpers.append(time.perf_counter() - t0)
+            result['median_cents'] = float(cents(np.median(
+                pitches[pitches > 0]), target))
+            result['avg_pitch_cents'] = float(cents(avg, target))
+            median_err.append(abs(result['median_cents']))
+            avg_err.append(abs(result['avg_pitch_cents']))
+            hits.append(abs(cents(note, target)) < 50)
+        else:
+            hits.append(False)
+        per_signal[label] = result
+
+    total = float(sum(latencies))
+    report = {'params': params,
+              'calls': len(latencies),
+              'frames_per_second': frames / total if total else None,
+              'latency_seconds': _percentiles(latencies),
+              'peak_memory_bytes': int(max(peaks)),
+              'voiced_fraction': float(np.mean(voiced))}
+    if per_signal:
+        report['accuracy'] = {
+            'labelled_signals': len(per_signal),
+            'median_abs_cents': float(np.median(median_err))
+            if median_err else None,
+            'avg_pitch_median_abs_cents': float(np.median(avg_err))
+            if avg_err else None,
+            'within_50_cents': float(np.sum(np.asarray(median_err) < 50))
+            / len(per_signal),
+            'note_accuracy': float(np.mean(hits))}
+        report['avg_pitch_quantize_seconds'] = \
+            _percentiles(helpers) if helpers else None
+        report['signals'] = per_signal
+    return report
+
+
+def detector_benchmark(detectors=None, corpus=True, synthetic_seconds=(),
+                       repeats=3, params=None):
+    """
+    benchmark report for several detectors, see ``benchmark_detector``
+
+    Parameters
+    ----------
+    detectors : list of str
+        detector names, all registered detectors by default
+    corpus : bool
+        include every WAV in ``tuner/GuitarNotes``
+    synthetic_seconds : sequence of float
+        lengths of synthetic harmonic test signals to add
+    repeats : int
+        timed calls per signal
+    params : dict
+        optional ``{name: kwargs}`` for the detectors
+    """
+    detectors = detectors or sorted(tunertools.DETECTORS)
+    params = params or {}
+    signals = load_corpus() if corpus else []
+    signals += synthetic_corpus(synthetic_seconds)
+    report = {'meta': {'python': platform.python_version(),
+                       'numpy': np.__version__,
+                       'machine': platform.machine(),
+                       'signals': len(signals),
+                       'audio_seconds': sum(len(sig) / float(sr)
+                                            for _, sr, sig, _ in signals),
+                       'repeats': repeats},
+              'detectors': {}}
+    for name in detectors:
+        report['detectors'][name] = benchmark_detector(
+            name, signals, repeats, params.get(name))
+    return report
+
+
+def synthetic_chord(detune, sr=44100, seconds=0.5, harmonics=8, noise=0.05,
+                    seed=0):
+    """
+    six-string strum in standard tuning with plucked-string harmonics
+
+    Parameters
+    ----------
+    detune : sequence of float
+        deviation of each string from standard tuning in cents
+    sr : int
+        samplerate
+    seconds : float
+        length of the signal
+    harmonics : int
+        harmonics per string, amplitude falling as 1/k**1.2
+    noise : float
+        standard deviation of added white noise
+    seed : int
+        seed for phases and noise
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(sr * seconds)) / float(sr)
+    sig = np.zeros(len(t))
+    for midi, cents_off in zip(tunertools.STANDARD_TUNING, detune):
+        f0 = midi_to_hz(midi) * 2.0 ** (cents_off / 1200.0)
+        for k in range(1, harmonics + 1):
+            sig += np.sin(2 * np.pi * f0 * k * t + rng.uniform(0, 2 * np.pi)) \
+                * np.exp(-2 * t) / k ** 1.2
+    sig += rng.normal(0, noise, len(t))
+    return (0.5 * sig / np.abs(sig).max()).astype(np.float32)
+
+
+def strum_benchmark(trials=20, seconds=0.5, max_detune=40.0, sr=44100):
+    """
+    accuracy and cost of ``tunertools.string_deviations``
+
+    Parameters
+    ----------
+    trials : int
+        random chords analysed
+    seconds : float
+        length of each chord, i.e. the analysis window
+    max_detune : float
+        strings are detuned uniformly within +/- this many cents
+    sr : int
+        samplerate
+
+    ``realtime_load`` is analysis time per second of audio when a
+    window is analysed every ``seconds / 2`` (the tuner's strum rate).
+    """
+    rng = np.random.default_rng(0)
+    errors, times = [], []
+    for trial in range(trials):
+        detune = rng.uniform(-max_detune, max_detune, 6)
+        chord = synthetic_chord(detune, sr, seconds, seed=trial)
+        t0 = time.perf_counter()
+        result = tunertools.string_deviations(chord, sr)
+        times.append(time.perf_counter() - t0)
+        errors.append(np.abs(result.cents - detune))
+    errors = np.asarray(errors)
+    return {'trials': trials, 'seconds': seconds, 'max_detune': max_detune,
+            'strings': [str(label) for label in result.labels],
+            'median_abs_cents': np.median(errors, axis=0).round(2).tolist(),
+            'p90_abs_cents': np.percentile(errors, 90, axis=0).round(2)
+            .tolist(),
+            'latency_seconds': _percentiles(times),
+            'realtime_load': float(np.mean(times) / (seconds / 2))}
+
+
+def _measure(func, *args):
+    """peak traced bytes and memory blocks allocated by one call
+
+    The call's return value is held while the blocks are counted, so
+    whatever it builds for the next stage shows up in the count.
+    """
+    before_blocks = sys.getallocatedblocks()
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    out = func(*args)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    blocks = sys.getallocatedblocks() - before_blocks
+    del out
+    return peak, blocks
+
+
+def alloc_benchmark(blocksize=4096, n_blocks=50, sr=44100, channels=1):
+    """
+    per-callback memory of the original and the current capture path
+
+    Parameters
+    ----------
+    blocksize : int
+        frames per callback
+    n_blocks : int
+        number of callbacks measured
+    sr : int
+        samplerate
+    channels : int
+        input channels of the simulated stream
+
+    ``legacy`` replays the original capture: the block is flattened into
+    a Python list once for YIN and once for YAAPT, and each list is
+    converted back to a float64 array. ``current`` copies the block into
+    the pipeline's buffer pool and writes a mono view into the tracker's
+    ring buffer. Detection itself is measured separately (``detection``),
+    since it does the same work on both paths.
+    """
+    sig = tunertools.synthetic_note(110.0, sr,
+                                    blocksize * n_blocks / float(sr), 4,
+                                    noise=0.0)
+    blocks = np.repeat(sig.reshape(n_blocks, blocksize, 1), channels, 2)
+    tracker = tunertools.PitchTracker(sr, max_block=blocksize)
+    pipeline = AnalysisPipeline(None)
+
+    def legacy(block):
+        yin_in = [i for j in block for i in j]
+        yaapt_in = [i for j in block for i in j]
+        return (yin_in, np.array(yin_in, np.float64),
+                yaapt_in, np.array(yaapt_in))
+
+    def current(block):
+        # the same work as feed() followed by the worker, on one thread
+        pipeline.feed(block)
+        buf, captured = pipeline.blocks.popleft()
+        tracker.ring.write(tunertools.as_mono(buf))
+        pipeline.free.append(buf)
+
+    def detection(block):
+        return tracker.push(tunertools.as_mono(block))
+
+    report = {'blocksize': blocksize, 'n_blocks': n_blocks,
+              'channels': channels}
+    tracemalloc.start()
+    try:
+        for name, func in (('legacy', legacy), ('current', current),
+                           ('detection', detection)):
+            tracker.reset()
+            func(blocks[0])      # warm up buffers and caches
+            peaks, counts, times = [], [], []
+            for block in blocks:
+                t0 = time.perf_counter()
+                peak, count = _measure(func, block)
+                times.append(time.perf_counter() - t0)
+                peaks.append(peak)
+                counts.append(count)
+            report[name] = {
+                'peak_bytes_per_callback': int(np.mean(peaks)),
+                'allocated_blocks_per_callback': float(np.mean(counts)),
+                'mean_seconds_per_callback': float(np.mean(times))}
+    finally:
+        tracemalloc.stop()
+    return report
+
+
+def incremental_benchmark(hops=(64, 128, 256, 441), wl=1323, f0_min=65,
+                          seconds=4.0, sr=44100, corpus=True):
+    """
+    per-hop cost and accuracy of the incremental YIN tracker
+
+    Parameters
+    ----------
+    hops : iterable of int
+        hop sizes (``ws``) to compare; audio is pushed one hop at a time
+    wl : int
+        window length
+    f0_min : float
+        lowest frequency, sets ``t_max``
+    seconds : float
+        length of the synthetic signal used for timing
+    sr : int
+        samplerate
+    corpus : bool
+        also compare against ``YIN`` on the GuitarNotes recordings
+
+    For each hop, reports microseconds per hop of ``PitchTracker`` (an
+    FFT per frame) and ``IncrementalPitchTracker``, the largest
+    difference in harmonic rate (the CMNDF at the chosen lag) from
+    ``YIN`` and the number of frames whose pitch differs.
+    """
+    timing = tunertools.synthetic_note(110.0, sr, seconds, 6, noise=0.05)
+    signals = [(sr, timing)] + ([(rate, sig) for _, rate, sig, _ in
+                                 load_corpus()] if corpus else [])
+    report = {'wl': wl, 'f0_min': f0_min, 'hops': {}}
+    for ws in hops:
+        entry = {}
+        for name, cls in (('fft', tunertools.PitchTracker),
+                          ('incremental', tunertools.IncrementalPitchTracker)):
+            best = None
+            for _ in range(3):
+                tracker = cls(sr, wl, ws, f0_min)
+                t0 = time.perf_counter()
+                for i in range(0, len(timing), ws):
+                    tracker.push(timing[i:i + ws])
+                elapsed = time.perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+            entry[name + '_us_per_hop'] = best / (len(timing) // ws) * 1e6
+        max_hr, differing, frames = 0.0, 0, 0
+        for rate, sig in signals:
+            sig = np.asarray(sig, np.float64)
+            pitches, hr, _, _ = tunertools.YIN(sig, rate, wl, ws, f0_min)
+            tracker = tunertools.IncrementalPitchTracker(rate, wl, ws,
+                                                         f0_min)
+            out = [tracker.push(sig[i:i + ws])
+                   for i in range(0, len(sig), ws)]
+            inc_pitches, inc_hr = (np.concatenate(r)[:len(pitches)]
+                                   for r in list(zip(*out))[:2])
+            if len(pitches):
+                max_hr = max(max_hr, float(np.abs(inc_hr - hr).max()))
+            differing += int((inc_pitches != pitches).sum())
+            frames += len(pitches)
+        entry.update(max_harmonic_rate_error=max_hr,
+                     differing_pitches=differing, frames=frames)
+        report['hops'][ws] = entry
+    return report
+
+
+def decimation_benchmark(targets=(11025, 8000), wl=1323, ws=441,
+                         f0_min=65, repeats=3):
+    """
+    cost and accuracy of decimated YIN against full-rate YIN
+
+    Parameters
+    ----------
+    targets : iterable of float
+        decimation target rates to compare
+    wl, ws, f0_min :
+        YIN parameters, in samples at the recording rate
+    repeats : int
+        timing runs per file, the fastest is kept
+
+    Both sides use parabolic lag refinement, so the comparison measures
+    what decimation loses rather than integer-lag quantisation. For
+    each target, reports the total seconds spent on the GuitarNotes
+    corpus and the difference in cents between the median voiced pitch
+    of each file at full and at decimated rate.
+    """
+    def timed(sig, sr, **params):
+        best = None
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            out = tunertools.YIN(sig, sr, wl, ws, f0_min, refine=True,
+                                 **params)
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        pitches = out[0][out[0] > 0]
+        return best, float(np.median(pitches)) if len(pitches) else None
+
+    corpus = load_corpus()
+    full = [timed(sig, sr) for _, sr, sig, _ in corpus]
+    report = {'wl': wl, 'ws': ws, 'f0_min': f0_min, 'files': len(corpus),
+              'full_rate_seconds': sum(t for t, _ in full), 'targets': {}}
+    for target in targets:
+        seconds, errors = 0.0, []
+        for (name, sr, sig, _), (_, ref) in zip(corpus, full):
+            elapsed, median = timed(sig, sr, target_sr=target)
+            seconds += elapsed
+            if ref and median:
+                errors.append(abs(float(cents(median, ref))))
+        entry = {'seconds': seconds,
+                 'speedup': report['full_rate_seconds'] / seconds,
+                 'within_1_cent': float(np.mean(np.array(errors) <= 1.0))}
+        entry.update(('cents_' + k, v)
+                     for k, v in _percentiles(errors).items())
+        report['targets'][target] = entry
+    return report
+
+
+def pipeline_benchmark(source='synthetic:110', blocksize=512, realtime=False,
+                       target_sr=11025, channels=None):
+    """
+    the live capture-to-pitch path, headless, on a virtual input
+
+    Parameters
+    ----------
+    source : str
+        virtual input spec, see ``tunertools.virtual_input``
+    blocksize : int
+        frames per callback
+    realtime : bool
+        pace the input in real time instead of as fast as possible
+    target_sr : float
+        decimation target of the tracker, None for full rate
+    channels : sequence of int
+        input channels analysed, as for ``tunertools.AudioEngine``
+
+    Streams ``source`` through ``AudioEngine.open_input``, an
+    ``AnalysisPipeline`` and the tuner's ``PitchTracker`` settings, and
+    reports how much faster than real time it ran, the block counters
+    and the median detected pitch.
+    """
+    engine = tunertools.AudioEngine(source, blocksize=blocksize,
+                                    channels=channels)
+    sr = engine.input_samplerate()
+    tracker = tunertools.PitchTracker(sr, 1323, 441, 65,
+                                      max_block=blocksize,
+                                      target_sr=target_sr)
+    pitches = []
+
+    def analyse(block):
+        p, _, _, _ = tracker.push(engine.select(block))
+        pitches.extend(p[p > 0])
+
+    sig, _ = engine.virtual()
+    # a queue that holds the whole input, so nothing is dropped when the
+    # input runs faster than real time
+    pipeline = AnalysisPipeline(analyse, maxsize=len(sig) // blocksize + 1)
+    stream = engine.open_input(pipeline.feed, realtime)
+    pipeline.start()
+    t0 = time.perf_counter()
+    stream.start()
+    stream.finished.wait()
+    n_blocks = -(-len(sig) // blocksize)
+    while pipeline.processed_blocks + pipeline.dropped_blocks < n_blocks \
+            and pipeline.error is None:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - t0
+    stream.close()
+    pipeline.stop()
+    report = {'source': source, 'samplerate': sr, 'blocksize': blocksize,
+              'seconds_of_audio': len(sig) / float(sr),
+              'wall_seconds': elapsed,
+              'realtime_factor': len(sig) / float(sr) / elapsed,
+              'median_pitch': float(np.median(pitches)) if pitches else None}
+    report.update(pipeline.stats())
+    return report
+
+
+STARTUP_SCRIPT = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import tunertools
+report = {'import_tunertools': time.perf_counter() - t0}
+try:
+    import tuner
+    report['import_tuner'] = time.perf_counter() - t0
+    root = tuner.Tuner()
+    root.update()           # first frame drawn
+    report['first_frame'] = time.perf_counter() - t0
+    root.assets.join()
+    report['assets_loaded'] = time.perf_counter() - t0
+    root.destroy()
+except Exception as e:      # no display, no audio device, ...
+    report['gui_error'] = '%s: %s' % (type(e).__name__, e)
+    t1 = time.perf_counter()
+    # no sounddevice import: without PortAudio it raises OSError
+    report['warm_up'] = tunertools.warm_up(target_sr=11025, audio=False)
+    report['warm_up_total'] = time.perf_counter() - t1
+print(json.dumps(report))
+"""
+
+
+def startup_benchmark(repeats=5):
+    """
+    cold-start times of the tuner, each run in a fresh interpreter
+
+    Parameters
+    ----------
+    repeats : int
+        interpreters started; the median of each time is reported
+
+    Reports seconds since interpreter start to ``import tunertools``,
+    to ``import tuner``, to the first drawn frame of the window and to
+    the end of the background asset loading. Without a display the GUI
+    times are missing and the cost of ``tunertools.warm_up`` (the lazy
+    detector backends, without sounddevice) is reported instead.
+    """
+    import subprocess
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=here,
+                             capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    report = {'repeats': repeats}
+    for key in runs[0]:
+        values = [run[key] for run in runs if key in run]
+        if isinstance(values[0], float):
+            report[key] = float(np.median(values))
+        elif isinstance(values[0], dict):
+            report[key] = {k: float(np.median([v[k] for v in values]))
+                           for k in values[0]}
+        else:
+            report[key] = values[0]
+    return report
+
+
+def gate_benchmark(silence=2.0, noise=0.002, blocksize=512, wl=1323, ws=441,
+                   f0_min=65, target_sr=11025):
+    """
+    CPU saved by ``SignalGate`` and how well it finds the pluck
+
+    Parameters
+    ----------
+    silence : float
+        seconds of background noise before and after each note
+    noise : float
+        standard deviation of the background noise
+    blocksize : int
+        samples per callback block
+    wl, ws, f0_min, target_sr :
+        settings of the live YIN tracker
+
+    Each GuitarNotes file is played between two stretches of noise
+    through a tracker that sees every block, and through the gate with
+    the tracker only fed (and reset at each onset) while the gate is
+    open, as the tuner does. Reports the seconds spent each way, the
+    fraction of blocks analysed, onsets per file and the distance in
+    ms from the first onset to the start of the note.
+    """
+    rng = np.random.default_rng(0)
+    ungated = gated = 0.0
+    blocks = analysed = 0
+    onsets, errors = [], []
+    for name, sr, sig, _ in load_corpus():
+        pad = int(silence * sr)
+        session = np.concatenate([rng.normal(0, noise, pad), sig,
+                                  rng.normal(0, noise, pad)])
+        session = session.astype(np.float32)
+        chunks = [session[i:i + blocksize]
+                  for i in range(0, len(session) - blocksize + 1, blocksize)]
+        tracker = tunertools.PitchTracker(sr, wl, ws, f0_min,
+                                          max_block=blocksize,
+                                          target_sr=target_sr)
+        t0 = time.perf_counter()
+        for chunk in chunks:
+            tracker.push(chunk)
+        ungated += time.perf_counter() - t0
+        tracker.reset()
+        gate = tunertools.SignalGate(sr)
+        found = []
+        t0 = time.perf_counter()
+        for i, chunk in enumerate(chunks):
+            state = gate.update(chunk)
+            if not gate.open:
+                continue
+            if state == gate.ONSET:
+                tracker.reset()
+                found.append(i * blocksize)
+            tracker.push(chunk)
+            analysed += 1
+        gated += time.perf_counter() - t0
+        blocks += len(chunks)
+        onsets.append(len(found))
+        if found:
+            errors.append(abs(found[0] - pad) * 1e3 / sr)
+    report = {'files': len(onsets), 'blocks': blocks,
+              'analysed_fraction': analysed / float(blocks),
+              'ungated_seconds': ungated, 'gated_seconds': gated,
+              'cpu_saved': 1 - gated / ungated,
+              'files_with_one_onset': sum(n == 1 for n in onsets),
+              'files_without_onset': sum(n == 0 for n in onsets),
+              'mean_onsets_per_file': float(np.mean(onsets))}
+    report.update(('onset_error_ms_' + k, v)
+                  for k, v in _percentiles(errors).items())
+    return report
+
+
+def smoothing_benchmark(wl=1323, ws=441, f0_min=65, target_sr=11025,
+                        min_confidence=0.85):
+    """
+    stability of the displayed pitch with and without ``PitchSmoother``
+
+    Parameters
+    ----------
+    wl, ws, f0_min, target_sr :
+        YIN settings, as in the tuner; a small ``ws`` updates faster
+    min_confidence : float
+        frames with a lower confidence are not shown
+
+    For every GuitarNotes file, the raw reading is the newest confident
+    frame (what the tuner showed before) and the smoothed reading is the
+    ``PitchSmoother`` output after each frame. Reports, for both, the
+    frame-to-frame jitter in cents, how often the note label changes
+    and how often the reading jumps by more than half an octave from one
+    frame to the next (all ideally rare for a single plucked note), plus
+    the smoother's cost per frame.
+    """
+    def stats(cents_seq, labels):
+        cents_seq = np.asarray(cents_seq)
+        return {'jitter_cents': float(np.median(np.abs(np.diff(cents_seq))))
+                if len(cents_seq) > 1 else 0.0,
+                'label_changes': sum(a != b for a, b in
+                                     zip(labels, labels[1:])),
+                'octave_jumps': int((np.abs(np.diff(cents_seq))
+                                     > 600).sum())}
+
+    raw, smooth, seconds, frames = [], [], 0.0, 0
+    for name, sr, sig, target in load_corpus():
+        pitches, hr, _, _ = tunertools.YIN(sig, sr, wl, ws, f0_min,
+                                           target_sr=target_sr)
+        ok = (pitches > 0) & (tunertools.confidence(hr) >= min_confidence)
+        if not ok.any():
+            continue
+        ref = float(np.median(pitches[ok]))
+        raw_cents = cents(pitches[ok], ref)
+        labels = list(tunertools.nearest_note(pitches[ok])[0])
+        raw.append(stats(raw_cents, labels))
+        smoother = tunertools.PitchSmoother(min_confidence=min_confidence)
+        t0 = time.perf_counter()
+        out = [smoother.update(float(f), float(h))
+               for f, h in zip(pitches, hr)]
+        seconds += time.perf_counter() - t0
+        frames += len(pitches)
+        out = [o for o in out if o is not None]
+        smooth.append(stats(cents(np.array([o.pitch for o in out]), ref),
+                            [o.label for o in out]))
+
+    def total(runs):
+        return {'median_jitter_cents':
+                float(np.median([r['jitter_cents'] for r in runs])),
+                'label_changes': sum(r['label_changes'] for r in runs),
+                'octave_jumps': sum(r['octave_jumps'] for r in runs)}
+
+    return {'wl': wl, 'ws': ws, 'files': len(raw), 'raw': total(raw),
+            'smoothed': total(smooth),
+            'smoother_us_per_frame': seconds / frames * 1e6}
+
+
+def channels_benchmark(channels=(1, 2, 4, 8), seconds=2.0, blocksize=512,
+                       sr=44100, yin_params=None):
+    """
+    throughput of per-channel tracking, serial and on a ``ChannelPool``
+
+    Parameters
+    ----------
+    channels : iterable of int
+        numbers of input channels to try
+    seconds : float
+        length of the synthetic multi-channel recording
+    blocksize : int
+        frames per callback block
+    sr : int
+        samplerate
+    yin_params : dict
+        ``PitchTracker`` settings, ``LIVE_YIN_PARAMS`` by default
+
+    Every channel carries a different sustained note, so the gate stays
+    open and each block runs YIN and the smoother on every channel.
+    Reports seconds per block for each count, run one channel after the
+    other and on the pool, and how many times faster than real time the
+    pool keeps up.
+    """
+    report = {'blocksize': blocksize, 'sr': sr, 'cpus': os.cpu_count(),
+              'channels': {}}
+    for n in channels:
+        sig = np.stack([tunertools.synthetic_note(
+            midi_to_hz(40 + 5 * (i % 6) + 12 * (i // 6)), sr, seconds,
+            seed=i) for i in range(n)], axis=1)
+        blocks = [sig[i:i + blocksize]
+                  for i in range(0, len(sig) - blocksize + 1, blocksize)]
+        entry = {}
+        for mode, workers in (('serial', 1), ('pool', None)):
+            pool = ChannelPool([ChannelTracker(sr, yin_params, blocksize)
+                                for _ in range(n)], workers)
+            t0 = time.perf_counter()
+            for block in blocks:
+                pool.process([block[:, c] for c in range(n)])
+            entry[mode + '_ms_per_block'] = \
+                (time.perf_counter() - t0) / len(blocks) * 1e3
+            pool.close()
+        entry['speedup'] = entry['serial_ms_per_block'] / \
+            entry['pool_ms_per_block']
+        entry['realtime_factor'] = blocksize / float(sr) * 1e3 / \
+            entry['pool_ms_per_block']
+        report['channels'][n] = entry
+    return report
+
+
+def cache_benchmark(detectors=('yin',), directory=None):
+    """
+    cold and warm runs over the GuitarNotes corpus through a ``TrackCache``
+
+    Parameters
+    ----------
+    detectors : iterable of str
+        names in ``tunertools.DETECTORS``
+    directory : str
+        cache directory; a temporary one (removed afterwards) by default
+
+    For each detector, reports the seconds for the corpus with an empty
+    cache (detector plus store), with a warm one (hash plus load), the
+    part of the warm run spent hashing the samples, and the bytes
+    stored per file.
+    """
+    import shutil
+    import tempfile
+    tmp = None
+    if directory is None:
+        directory = tmp = tempfile.mkdtemp(prefix='pytuner-cache-')
+    corpus = load_corpus()
+    report = {'files': len(corpus), 'detectors': {}}
+    try:
+        for name in detectors:
+            cache = trackcache.TrackCache(directory, max_bytes=None)
+            runs = {}
+            for run in ('cold', 'warm'):
+                t0 = time.perf_counter()
+                for _, sr, sig, _ in corpus:
+                    cache.compute(name, sig, sr)
+                runs[run] = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            for _, sr, sig, _ in corpus:
+                cache.key(name, sig, sr)
+            hashing = time.perf_counter() - t0
+            stats = cache.stats()
+            report['detectors'][name] = {
+                'cold_seconds': runs['cold'], 'warm_seconds': runs['warm'],
+                'speedup': runs['cold'] / runs['warm'],
+                'hash_seconds': hashing,
+                'bytes_per_file': stats['bytes'] / float(stats['entries'])}
+            cache.clear()
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return report
+
+
+def fft_benchmark(workers=(1, None), wl=1323, ws=441, f0_min=65,
+                  repeats=3):
+    """
+    speed of the YIN FFT backends and the accuracy cost of float32
+
+    Parameters
+    ----------
+    workers : iterable of int
+        ``FFTBackend`` thread counts to time; None is every CPU
+    wl, ws, f0_min :
+        YIN settings at the recording rate
+    repeats : int
+        timing runs, the fastest is kept
+
+    Times ``batchDifferenceFunction`` over every frame of the
+    GuitarNotes corpus in one batch: ``np.fft`` (the old code path),
+    then ``scipy.fft`` per worker count, in float64 and float32. The
+    accuracy of float32 is the difference in cents between float32 and
+    float64 YIN pitches on frames both call voiced, with and without
+    parabolic refinement, plus the fraction of frames whose voicing
+    changes.
+    """
+    corpus = load_corpus()
+    frames = np.concatenate([tunertools.frame_signal(sig, wl, ws)
+                             for _, _, sig, _ in corpus])
+    t_max = int(corpus[0][1] / f0_min)
+
+    def timed(backend):
+        backend.difference(frames[:2], t_max)      # import and sizes
+        best = None
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            backend.difference(frames, t_max)
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    report = {'frames': len(frames), 'wl': wl, 't_max': t_max,
+              'cpus': os.cpu_count(), 'seconds': {}}
+    report['seconds']['numpy_float64'] = timed(
+        tunertools.FFTBackend(1, 'float64', use_scipy=False))
+    for n in workers:
+        for precision in ('float64', 'float32'):
+            backend = tunertools.FFTBackend(n or os.cpu_count() or 1,
+                                            precision)
+            report['seconds']['scipy_%s_workers_%d' % (
+                precision, backend.workers)] = timed(backend)
+
+    default = tunertools.FFT_BACKEND
+    for refine in (False, True):
+        errors, flips, total = [], 0, 0
+        for _, sr, sig, _ in corpus:
+            pitches = {}
+            for precision in ('float64', 'float32'):
+                tunertools.FFT_BACKEND = tunertools.FFTBackend(
+                    precision=precision)
+                try:
+                    pitches[precision] = tunertools.YIN(
+                        sig, sr, wl, ws, f0_min, refine=refine)[0]
+                finally:
+                    tunertools.FFT_BACKEND = default
+            p64, p32 = pitches['float64'], pitches['float32']
+            both = (p64 > 0) & (p32 > 0)
+            errors.extend(np.abs(cents(p32[both], p64[both])))
+            flips += int(((p64 > 0) != (p32 > 0)).sum())
+            total += len(p64)
+        entry = {'voicing_changes': flips / float(total)}
+        entry.update(('float32_cents_' + k, v)
+                     for k, v in _percentiles(errors).items())
+        report['refined' if refine else 'integer_lags'] = entry
+    return report
+
+
+def nccf_benchmark(targets=(None, 11025), repeats=1):
+    """
+    the in-tree NCCF tracker against pYAAPT (and YIN) on the corpus
+
+    Parameters
+    ----------
+    targets : iterable of float
+        ``target_sr`` settings of ``NCCF`` to run; None is full rate
+    repeats : int
+        timing runs per file, the fastest is kept
+
+    For each tracker, reports the seconds for the whole corpus and,
+    against the note named by each file, the median absolute error in
+    cents, the files whose median is more than 50 cents off (octave
+    errors), the share of voiced frames more than 50 cents off and the
+    voiced fraction. ``agrees_with_yaapt`` is the share of files where
+    the median pitch is within 50 cents of pYAAPT's.
+    """
+    corpus = [entry for entry in load_corpus() if entry[3] is not None]
+    runs = [('yaapt', tunertools.yaapt_detector, {}),
+            ('yin', tunertools.yin_detector, {})]
+    runs += [('nccf' if target is None else 'nccf_%d' % target,
+              tunertools.nccf_detector, {'target_sr': target})
+             for target in targets]
+    medians = {}
+    report = {'files': len(corpus), 'trackers': {}}
+    for name, detector, params in runs:
+        seconds, errors, gross, voiced = 0.0, [], [], []
+        medians[name] = []
+        for _, sr, sig, target in corpus:
+            best = None
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                track = detector(sig, sr, **params)
+                elapsed = time.perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+            seconds += best
+            pitches = np.asarray(track.pitches)
+            voiced.append(float((pitches > 0).mean()))
+            if not (pitches > 0).any():
+                medians[name].append(np.nan)
+                errors.append(np.inf)
+                continue
+            median = float(np.median(pitches[pitches > 0]))
+            medians[name].append(median)
+            errors.append(abs(float(cents(median, target))))
+            gross.append(float(
+                (np.abs(cents(pitches[pitches > 0], target)) > 50).mean()))
+        errors = np.asarray(errors)
+        with np.errstate(invalid='ignore'):
+            agree = np.abs(cents(medians[name], medians['yaapt'])) < 50
+        report['trackers'][name] = {
+            'params': params, 'seconds': seconds,
+            'speedup_vs_yaapt': None,
+            'median_abs_cents': float(np.median(errors)),
+            'files_over_50_cents': int((errors > 50).sum()),
+            'gross_frame_errors': float(np.mean(gross)),
+            'voiced_fraction': float(np.mean(voiced)),
+            'agrees_with_yaapt': float(agree.mean())}
+    yaapt_seconds = report['trackers']['yaapt']['seconds']
+    for entry in report['trackers'].values():
+        entry['speedup_vs_yaapt'] = yaapt_seconds / entry['seconds']
+    return report
+
+
+def main(argv=None):
+    """Parse arguments, run the benchmark and print its JSON report"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--output', help='write the JSON report here')
+    sub = parser.add_subparsers(dest='command', required=True)
+    det = sub.add_parser('detectors', parents=[common],
+                         help='speed and accuracy per detector')
+    det.add_argument('--detectors', nargs='+',
+                     choices=sorted(tunertools.DETECTORS))
+    det.add_argument('--no-corpus', action='store_true',
+                     help='skip the GuitarNotes recordings')
+    det.add_argument('--synthetic-seconds', nargs='*', type=float, default=[],
+                     help='lengths of synthetic test signals to add')
+    det.add_argument('--repeats', type=int, default=3)
+    det.add_argument('--params', type=json.loads, default=None,
+                     help='JSON object of {detector: {param: value}}')
+    strum = sub.add_parser('strum', parents=[common],
+                           help='all-strings-at-once accuracy and cost')
+    strum.add_argument('--trials', type=int, default=20)
+    strum.add_argument('--seconds', type=float, default=0.5)
+    strum.add_argument('--max-detune', type=float, default=40.0)
+    alloc = sub.add_parser('alloc', parents=[common],
+                           help='capture path memory per callback')
+    alloc.add_argument('--blocksize', type=int, default=4096)
+    alloc.add_argument('--blocks', type=int, default=50)
+    alloc.add_argument('--channels', type=int, default=1)
+    inc = sub.add_parser('incremental', parents=[common],
+                         help='incremental vs per-frame FFT YIN tracking')
+    inc.add_argument('--hops', nargs='+', type=int,
+                     default=[64, 128, 256, 441])
+    inc.add_argument('--wl', type=int, default=1323)
+    inc.add_argument('--no-corpus', action='store_true',
+                     help='skip the GuitarNotes accuracy check')
+    dec = sub.add_parser('decimation', parents=[common],
+                         help='decimated vs full-rate YIN')
+    dec.add_argument('--targets', nargs='+', type=float,
+                     default=[11025, 8000])
+    dec.add_argument('--repeats', type=int, default=3)
+    pipe = sub.add_parser('pipeline', parents=[common],
+                          help='headless capture-to-pitch run on a '
+                          'virtual input')
+    pipe.add_argument('--source', default='synthetic:110',
+                      help='"file:<wav>" or "synthetic:<Hz>[,<Hz>...]"')
+    pipe.add_argument('--blocksize', type=int, default=512)
+    pipe.add_argument('--realtime', action='store_true')
+    pipe.add_argument('--channels', nargs='+', type=int, default=None)
+    start = sub.add_parser('startup', parents=[common],
+                           help='import time and time to first frame')
+    start.add_argument('--repeats', type=int, default=5)
+    gate = sub.add_parser('gate', parents=[common],
+                          help='silence and onset gating in front of YIN')
+    gate.add_argument('--silence', type=float, default=2.0)
+    gate.add_argument('--noise', type=float, default=0.002)
+    gate.add_argument('--blocksize', type=int, default=512)
+    smooth = sub.add_parser('smoothing', parents=[common],
+                            help='displayed pitch stability with and '
+                            'without temporal smoothing')
+    smooth.add_argument('--wl', type=int, default=1323)
+    smooth.add_argument('--ws', type=int, default=441)
+    chans = sub.add_parser('channels', parents=[common],
+                           help='multi-channel tracking throughput')
+    chans.add_argument('--channels', nargs='+', type=int,
+                       default=[1, 2, 4, 8])
+    chans.add_argument('--seconds', type=float, default=2.0)
+    chans.add_argument('--blocksize', type=int, default=512)
+    cache = sub.add_parser('cache', parents=[common],
+                           help='cold vs warm runs through the track cache')
+    cache.add_argument('--detectors', nargs='+', default=['yin'],
+                       choices=sorted(tunertools.DETECTORS))
+    cache.add_argument('--directory', help='cache directory to use '
+                       '(default: a temporary one)')
+    fft = sub.add_parser('fft', parents=[common],
+                         help='YIN FFT backends and float32 accuracy')
+    fft.add_argument('--workers', nargs='+', type=int, default=[1, None],
+                     help='thread counts to time (default: 1 and every '
+                     'CPU)')
+    fft.add_argument('--repeats', type=int, default=3)
+    nccf = sub.add_parser('nccf', parents=[common],
+                          help='in-tree NCCF tracker against pYAAPT')
+    nccf.add_argument('--targets', nargs='+', type=float,
+                      default=[11025],
+                      help='decimated rates to run besides the full one')
+    nccf.add_argument('--repeats', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.command == 'detectors':
+        report = detector_benchmark(args.detectors, not args.no_corpus,
+                                    args.synthetic_seconds, args.repeats,
+                                    args.params)
+    elif args.command == 'strum':
+        report = strum_benchmark(args.trials, args.seconds, args.max_detune)
+    elif args.command == 'alloc':
+        report = alloc_benchmark(args.blocksize, args.blocks,
+                                 channels=args.channels)
+    elif args.command == 'incremental':
+        report = incremental_benchmark(args.hops, args.wl,
+                                       corpus=not args.no_corpus)
+    elif args.command == 'decimation':
+        report = decimation_benchmark(args.targets, repeats=args.repeats)
+    elif args.command == 'pipeline':
+        report = pipeline_benchmark(args.source, args.blocksize,
+                                    args.realtime, channels=args.channels)
+    elif args.command == 'startup':
+        report = startup_benchmark(args.repeats)
+    elif args.command == 'gate':
+        report = gate_benchmark(args.silence, args.noise, args.blocksize)
+    elif args.command == 'smoothing':
+        report = smoothing_benchmark(args.wl, args.ws)
+    elif args.command == 'channels':
+        report = channels_benchmark(args.channels, args.seconds,
+                                    args.blocksize)
+    elif args.command == 'cache':
+        report = cache_benchmark(args.detectors, args.directory)
+    elif args.command == 'fft':
+        report = fft_benchmark(args.workers, repeats=args.repeats)
+    elif args.command == 'nccf':
+        report = nccf_benchmark([None] + args.targets, args.repeats)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
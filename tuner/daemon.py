@@ -0,0 +1,408 @@
+"""
+Headless tuner daemon streaming pitch results to local clients.
+
+One capture stream (or a virtual input, see ``tunertools.virtual_input``)
+is analysed once, by the same ``ChannelTracker`` pipeline as the tuner
+window, and every result is sent as one line of JSON to each connected
+client over TCP and/or a Unix socket::
+
+    python daemon.py --tcp 127.0.0.1:8765 --unix /tmp/pytuner.sock
+    PYTUNER_INPUT=synthetic:110 python daemon.py --tcp 127.0.0.1:8765
+    nc 127.0.0.1 8765
+
+Clients first receive a ``hello`` line with the stream settings, then
+``note``, ``strings`` (``--strum``), ``silent`` and periodic ``stats``
+lines. Each client has its own bounded queue: when a client does not
+keep up, its oldest lines are dropped (and counted in ``stats``), so a
+slow consumer never holds up the analysis or the other clients.
+"""
+
+__author__ = 'Vedant Mehta'
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import sys
+import tunertools
+from pipeline import AnalysisPipeline, ChannelPool, ChannelTracker
+
+
+def _number(value):
+    """float for JSON, None for nan"""
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+class Client:
+    """
+    One connected client: its bounded queue of encoded lines and the
+    task writing them out.
+    """
+
+    def __init__(self, writer, queue_size):
+        """__init__.
+
+        Parameters
+        ----------
+        writer : asyncio.StreamWriter
+            the client's connection
+        queue_size : int
+            lines waiting to be sent before the oldest are dropped
+        """
+        self.writer = writer
+        self.queue = asyncio.Queue(queue_size)
+        self.sent = 0
+        self.dropped = 0
+        peer = writer.get_extra_info('peername')
+        self.name = str(peer) if peer else 'unix'
+
+    def offer(self, line):
+        """offer.
+        Queue ``line`` without waiting, dropping the oldest if full
+
+        Parameters
+        ----------
+        line : bytes
+            encoded message
+        """
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(line)
+
+    async def send_loop(self):
+        """send_loop.
+        Write queued lines until the connection fails or is cancelled
+        """
+        while True:
+            line = await self.queue.get()
+            self.writer.write(line)
+            await self.writer.drain()
+            self.sent += 1
+
+
+class TunerDaemon:
+    """
+    Owns the input stream and the analysis, and fans results out to
+    every client.
+
+    Analysis runs on the ``AnalysisPipeline`` worker thread; each result
+    is encoded once and handed to the event loop with
+    ``call_soon_threadsafe``, which queues it for every client.
+    """
+
+    def __init__(self, engine=None, tcp=None, unix=None, queue_size=64,
+                 cascade=('yin', 'yaapt'), strum=False, yin_params=None,
+                 min_confidence=0.85, stats_interval=5.0, loop_input=False):
+        """__init__.
+
+        Parameters
+        ----------
+        engine : tunertools.AudioEngine
+            input device and stream settings; by default one configured
+            from the environment, as in the tuner
+        tcp : tuple
+            ``(host, port)`` to listen on, or None
+        unix : str
+            path of a Unix socket to listen on, or None
+        queue_size : int
+            lines buffered per client
+        cascade : sequence of str
+            'yin', which tracks every block, then the detectors escalated
+            to when it is not trusted; ('yin',) never escalates
+        strum : bool
+            report all six strings of each strum instead of single notes
+        yin_params : dict
+            ``PitchTracker`` settings, ``LIVE_YIN_PARAMS`` by default
+        min_confidence : float
+            frames below this confidence are left out of the pitch
+        stats_interval : float
+            seconds between ``stats`` lines, 0 for none
+        loop_input : bool
+            start a virtual input over when it ends instead of stopping
+        """
+        if not cascade or cascade[0] != 'yin':
+            # ChannelTracker always tracks with YIN and escalates from
+            # the second stage on
+            raise ValueError("the first detector must be 'yin', not %r"
+                             % (cascade[0] if cascade else None,))
+        self.engine = engine or tunertools.AudioEngine()
+        self.tcp = tcp
+        self.unix = unix
+        self.queue_size = queue_size
+        self.cascade = tunertools.Cascade(cascade) \
+            if len(cascade) > 1 else None
+        self.strum = strum
+        self.yin_params = yin_params
+        self.min_confidence = min_confidence
+        self.stats_interval = stats_interval
+        self.loop_input = loop_input
+        self.clients = set()
+        self.messages = 0
+        self.samplerate = None
+        self.pool = None
+        self.pipeline = None
+        self.rec = None
+        self.loop = None
+        self.stopping = None
+        self.blocks = 0
+
+    def hello(self):
+        """hello.
+        First message sent to every client
+        """
+        return {'type': 'hello', 'samplerate': self.samplerate,
+                'blocksize': self.engine.blocksize,
+                'channels': len(self.pool.trackers),
+                'input': str(self.engine.input_device),
+                'strum': self.strum}
+
+    def encode(self, message):
+        """encode.
+        One JSON line, as sent to clients
+        """
+        return (json.dumps(message) + '\n').encode()
+
+    def messages_for(self, channel, result, now):
+        """messages_for.
+
+        Parameters
+        ----------
+        channel : int
+            index of the analysed signal
+        result : tuple
+            result of ``ChannelTracker.process``
+        now : float
+            stream time in seconds at the end of the block
+
+        Returns the message dict for one channel's result.
+        """
+        kind, value = result
+        message = {'type': kind, 'channel': channel, 'time': now}
+        if kind == 'note':
+            message.update(note=value.label, pitch=value.pitch,
+                           target=value.target, cents=value.cents)
+        elif kind == 'strings':
+            message['strings'] = [
+                {'note': str(label), 'pitch': _number(pitch),
+                 'cents': _number(cents)}
+                for label, pitch, cents in zip(value.labels, value.pitches,
+                                               value.cents)]
+        return message
+
+    def analyse(self, data):
+        """analyse.
+        Runs on the pipeline worker thread for every block
+
+        Parameters
+        ----------
+        data : np.ndarray
+            ``(frames, channels)`` block from the input stream
+        """
+        self.blocks += 1
+        now = self.blocks * len(data) / float(self.samplerate)
+        results = self.pool.process(self.engine.split(data), self.strum)
+        for channel, result in enumerate(results):
+            if result is not None:
+                line = self.encode(self.messages_for(channel, result, now))
+                self.loop.call_soon_threadsafe(self.publish, line)
+        # nothing for the pipeline to keep: results go straight out
+        return None
+
+    def publish(self, line):
+        """publish.
+        Queue an encoded line for every client, on the event loop
+
+        Parameters
+        ----------
+        line : bytes
+            encoded message
+        """
+        self.messages += 1
+        for client in self.clients:
+            client.offer(line)
+
+    def stats(self):
+        """stats.
+        Pipeline counters and per-client delivery as a message dict
+        """
+        message = {'type': 'stats', 'messages': self.messages}
+        message.update(self.pipeline.stats())
+        message['clients'] = [{'client': c.name, 'sent': c.sent,
+                               'dropped': c.dropped,
+                               'queued': c.queue.qsize()}
+                              for c in self.clients]
+        return message
+
+    async def handle_client(self, reader, writer):
+        """handle_client.
+        Serve one connection until it closes or the daemon stops
+        """
+        client = Client(writer, self.queue_size)
+        client.offer(self.encode(self.hello()))
+        self.clients.add(client)
+        sender = asyncio.ensure_future(client.send_loop())
+        # clients send nothing; EOF (or an error) means they are gone
+        closed = asyncio.ensure_future(reader.read())
+        try:
+            await asyncio.wait([sender, closed, self.stopping],
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+            closed.cancel()
+            writer.close()
+
+    async def report_stats(self):
+        """report_stats.
+        Publish a ``stats`` line every ``stats_interval`` seconds
+        """
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            self.publish(self.encode(self.stats()))
+            if self.pipeline.error is not None:
+                print('analysis error: %r' % self.pipeline.error,
+                      file=sys.stderr)
+                self.pipeline.error = None
+
+    async def watch_input(self):
+        """watch_input.
+        Stop once a virtual input has played to the end
+        """
+        finished = getattr(self.rec, 'finished', None)
+        if finished is None:
+            return
+        while not finished.is_set():
+            await asyncio.sleep(0.1)
+        # let the worker finish the blocks already queued
+        while self.pipeline.blocks:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        self.stop()
+
+    def stop(self):
+        """stop.
+        Ask ``run`` to shut down
+        """
+        if not self.stopping.done():
+            self.stopping.set_result(None)
+
+    async def run(self, duration=None):
+        """run.
+
+        Parameters
+        ----------
+        duration : float
+            stop after this many seconds; None runs until ``stop``, a
+            signal, or the end of a virtual input
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stopping = self.loop.create_future()
+        self.samplerate = self.engine.input_samplerate()
+        self.pool = ChannelPool([
+            ChannelTracker(self.samplerate, self.yin_params,
+                           max_block=self.engine.blocksize,
+                           cascade=self.cascade,
+                           min_confidence=self.min_confidence)
+            for _ in range(self.engine.n_signals())])
+        servers = []
+        if self.tcp:
+            servers.append(await asyncio.start_server(
+                self.handle_client, *self.tcp))
+        if self.unix:
+            if os.path.exists(self.unix):
+                os.remove(self.unix)
+            servers.append(await asyncio.start_unix_server(
+                self.handle_client, self.unix))
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass        # not on Windows; Ctrl-C still interrupts
+        self.pipeline = AnalysisPipeline(self.analyse)
+        self.pipeline.start()
+        self.rec = self.engine.open_input(self.pipeline.feed,
+                                          loop=self.loop_input)
+        self.rec.start()
+        tasks = [asyncio.ensure_future(self.watch_input())]
+        if self.stats_interval:
+            tasks.append(asyncio.ensure_future(self.report_stats()))
+        if duration is not None:
+            self.loop.call_later(duration, self.stop)
+        try:
+            await self.stopping
+        finally:
+            self.rec.stop()
+            self.rec.close()
+            self.pipeline.stop()
+            self.pool.close()
+            for task in tasks:
+                task.cancel()
+            for server in servers:
+                server.close()
+                await server.wait_closed()
+            if self.unix and os.path.exists(self.unix):
+                os.remove(self.unix)
+
+
+def parse_address(text):
+    """``(host, port)`` from 'host:port' or just 'port'"""
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def main(argv=None):
+    """Parse arguments and run the daemon until interrupted"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--tcp', type=parse_address,
+                        help='listen on host:port (default 127.0.0.1:8765 '
+                        'when --unix is not given)')
+    parser.add_argument('--unix', help='listen on this Unix socket path')
+    parser.add_argument('--input', help='input device index or name, or '
+                        '"file:<wav>" / "synthetic:<Hz>[,<Hz>...]" '
+                        '(default: PYTUNER_INPUT or the system default)')
+    parser.add_argument('--channels', nargs='+', type=int, default=None,
+                        help='input channels to analyse')
+    parser.add_argument('--separate', action='store_true',
+                        help='analyse each channel on its own')
+    parser.add_argument('--blocksize', type=int, default=512)
+    parser.add_argument('--queue', type=int, default=64,
+                        help='lines buffered per client before dropping')
+    parser.add_argument('--detectors', nargs='+', default=['yin', 'yaapt'],
+                        choices=sorted(tunertools.DETECTORS),
+                        help="'yin', which tracks every block, then the "
+                        'detectors escalated to when YIN is not trusted, '
+                        "e.g. 'yin nccf' (default: yin yaapt)")
+    parser.add_argument('--strum', action='store_true',
+                        help='report every string of each strum')
+    parser.add_argument('--stats-interval', type=float, default=5.0)
+    parser.add_argument('--duration', type=float, default=None,
+                        help='stop after this many seconds')
+    parser.add_argument('--loop', action='store_true',
+                        help='repeat a file or synthetic input forever')
+    args = parser.parse_args(argv)
+    if args.detectors[0] != 'yin':
+        parser.error("--detectors must start with 'yin', the live tracker")
+
+    if args.input is not None and args.input.isdigit():
+        args.input = int(args.input)
+    tcp = args.tcp or (None if args.unix else ('127.0.0.1', 8765))
+    engine = tunertools.AudioEngine(args.input, blocksize=args.blocksize,
+                                    channels=args.channels,
+                                    separate=args.separate or None)
+    daemon = TunerDaemon(engine, tcp, args.unix, args.queue,
+                         args.detectors, args.strum,
+                         stats_interval=args.stats_interval,
+                         loop_input=args.loop)
+    try:
+        asyncio.run(daemon.run(args.duration))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -51,22 +51,18 @@ class LabelDropdown(tk.Frame):
         self.button = ttk.Button(self, text=self.buttonlabel+' ▶', style='DD.TButton', command=self.show)
         self.button.grid(row=0, column=0)
         self.style_init()
+        # built once; show and hide only grid and forget them
+        self.label_list = [self.indent+line for line in self.label.split('\n')] # notice that indent.join(label_list) would leave out the first line.
+        self.label_widgets = [ttk.Label(self, text=line, style='DD.TLabel')
+                              for line in self.label_list]
     def show(self):
         """
         Show Label
         """
         self.button['command'] = self.hide
         self.button['text'] = self.buttonlabel + ' ▼'
-        self.label_list = self.label.split('\n')
-        self.label_widgets = []
-        if len(self.label_widgets) == 0:
-            for i in range(len(self.label_list)):
-                self.label_list[i] = self.indent+self.label_list[i] # notice that indent.join(label_list) would leave out the first line.
-                self.label_widgets.append(ttk.Label(self, text=self.label_list[i], style='DD.TLabel'))
-                self.label_widgets[i].grid(row=i+1, column=0)
-        else:
-            for i in range(len(self.label_widgets)):
-                self.label_widgets[i].grid(row=i+1,column=0)
+        for i in range(len(self.label_widgets)):
+            self.label_widgets[i].grid(row=i+1, column=0)
     def hide(self):
         """
         Hide Docstring
@@ -0,0 +1,287 @@
+"""
+Frame-rate rendering for the tuner window.
+
+``FrameRenderer`` coalesces GUI updates to at most one per display
+frame: results arriving faster than that only replace the pending
+update, and nothing is redrawn between frames. ``CentsMeter`` shows the
+deviation from the target note as a needle and a strobe on one
+``tk.Canvas``; its items are created once and every frame only moves
+them, so animating it creates no widgets or canvas items::
+
+    renderer = FrameRenderer(root)
+    meter = CentsMeter(root)
+    renderer.animate(meter.step)
+    renderer.submit('meter', meter.set, -12.5)
+"""
+
+__author__ = 'Vedant Mehta'
+
+import math
+import time
+import tkinter as tk
+
+
+class FrameRenderer:
+    """
+    Runs GUI updates once per display frame through ``after``.
+
+    ``submit`` keeps only the newest update for each name until the next
+    frame; ``animate`` registers callbacks run every frame for as long
+    as they return True. The frame timer only runs while there is
+    something to do. All methods must be called on the Tk thread.
+    """
+
+    def __init__(self, widget, fps=60):
+        """__init__.
+
+        Parameters
+        ----------
+        widget : tk.Misc
+            any widget of the window, used for ``after``
+        fps : float
+            frames per second to render at most
+        """
+        self.widget = widget
+        self.interval = max(1, int(round(1000.0 / fps)))
+        self.pending = {}
+        self.animations = []
+        self.after_id = None
+        self.last_frame = None
+        self.frames = 0
+        self.submitted = 0
+        self.applied = 0
+
+    def submit(self, name, func, *args):
+        """submit.
+        Run ``func(*args)`` on the next frame, replacing any update
+        still pending under ``name``
+
+        Parameters
+        ----------
+        name : str
+            what is updated, e.g. 'note'
+        func : callable
+            applies the update to the widgets
+        args :
+            arguments for ``func``
+        """
+        self.submitted += 1
+        self.pending[name] = (func, args)
+        self.schedule()
+
+    def animate(self, func):
+        """animate.
+        Call ``func(dt)`` every frame, with the seconds since the last
+        one, until it returns False
+        """
+        if func not in self.animations:
+            self.animations.append(func)
+        self.schedule()
+
+    def stop_animation(self, func):
+        """stop_animation.
+        Remove a callback registered with ``animate``
+        """
+        if func in self.animations:
+            self.animations.remove(func)
+
+    def schedule(self):
+        """schedule.
+        Start the frame timer if it is not running
+        """
+        if self.after_id is None:
+            self.after_id = self.widget.after(self.interval, self.frame)
+
+    def frame(self):
+        """frame.
+        Run the animations, then the newest pending updates
+        """
+        self.after_id = None
+        now = time.perf_counter()
+        dt = self.interval / 1000.0 if self.last_frame is None \
+            else now - self.last_frame
+        self.last_frame = now
+        # animations first: one that polls for results can submit
+        # updates that are then drawn in this same frame
+        self.animations = [func for func in self.animations if func(dt)]
+        pending, self.pending = self.pending, {}
+        for func, args in pending.values():
+            func(*args)
+        self.applied += len(pending)
+        self.frames += 1
+        if self.animations or self.pending:
+            self.schedule()
+        else:
+            self.last_frame = None
+
+    def cancel(self):
+        """cancel.
+        Drop pending updates and animations and stop the frame timer
+        """
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+        self.pending = {}
+        self.animations = []
+        self.last_frame = None
+
+
+class CentsMeter(tk.Canvas):
+    """
+    Needle and strobe display of a deviation in cents.
+
+    The needle swings over a ``±range_cents`` scale and eases towards
+    the latest value; the strobe bands above it drift right when the
+    note is sharp and left when flat, faster the further off it is, and
+    stand still in tune. ``set`` only records the value; ``step`` moves
+    the existing items and is meant to be run every frame (see
+    ``FrameRenderer.animate``).
+    """
+
+    def __init__(self, master, width=300, height=130, range_cents=50,
+                 tuned_cents=5, bands=12, strobe_speed=4.0, response=15.0,
+                 bg='#ffffff', **kwargs):
+        """__init__.
+
+        Parameters
+        ----------
+        master : tk.Misc
+            parent widget
+        width : int
+            canvas width in pixels
+        height : int
+            canvas height in pixels
+        range_cents : float
+            deviation at either end of the scale
+        tuned_cents : float
+            deviation drawn as in tune, in green
+        bands : int
+            strobe bands across the canvas
+        strobe_speed : float
+            strobe drift in pixels per second for each cent off
+        response : float
+            how quickly the needle follows, per second
+        bg : str
+            background color
+        """
+        super(CentsMeter, self).__init__(master, width=width, height=height,
+                                         bg=bg, highlightthickness=0,
+                                         **kwargs)
+        self.width = width
+        self.height = height
+        self.range_cents = range_cents
+        self.tuned_cents = tuned_cents
+        self.strobe_speed = strobe_speed
+        self.response = response
+        self.spacing = width / float(bands)
+        self.pivot = (width / 2.0, height - 10)
+        self.radius = height - 40
+        # state: target and displayed deviation, strobe offset
+        self.cents = None
+        self.shown = 0.0
+        self.phase = 0.0
+        self.strobe_x = 0.0
+        self.drawn = None
+        self.draw_scale()
+        self.draw_strobe(bands)
+        self.needle = self.create_line(*self.needle_coords(0.0), width=3,
+                                       fill='#999999', capstyle='round')
+        self.readout = self.create_text(8, height - 8, anchor='sw',
+                                        text='', font='Futura 12')
+
+    def angle(self, cents):
+        """angle.
+        Needle angle from vertical, in radians, for a deviation
+        """
+        cents = max(-self.range_cents, min(self.range_cents, cents))
+        return cents / float(self.range_cents) * math.radians(60)
+
+    def point(self, cents, radius):
+        """point.
+        Canvas coordinates ``radius`` pixels from the pivot towards
+        ``cents``
+        """
+        a = self.angle(cents)
+        return (self.pivot[0] + radius * math.sin(a),
+                self.pivot[1] - radius * math.cos(a))
+
+    def needle_coords(self, cents):
+        """needle_coords.
+        ``(x0, y0, x1, y1)`` of the needle at ``cents``
+        """
+        return self.pivot + self.point(cents, self.radius)
+
+    def draw_scale(self):
+        """draw_scale.
+        Ticks every 10 cents and the in-tune zone, drawn once
+        """
+        step = 10
+        for cents in range(-self.range_cents, self.range_cents + 1, step):
+            inner = self.radius - (12 if cents % 50 == 0 else 6)
+            self.create_line(*(self.point(cents, inner) +
+                               self.point(cents, self.radius)),
+                             fill='#000000')
+        zone = [self.point(c, self.radius + 4)
+                for c in (-self.tuned_cents, self.tuned_cents)]
+        self.create_line(*(zone[0] + zone[1]), fill='#2e8b57', width=4)
+
+    def draw_strobe(self, bands):
+        """draw_strobe.
+        The strobe bands, one spare on the left so the row can wrap
+        """
+        for i in range(-1, bands):
+            x = i * self.spacing
+            self.create_rectangle(x, 0, x + self.spacing / 2.0, 12,
+                                  fill='#cccccc', outline='',
+                                  tags='strobe')
+
+    def set(self, cents=None):
+        """set.
+
+        Parameters
+        ----------
+        cents : float
+            deviation of the current note from its target; None when
+            there is no note, which parks the needle and the strobe
+        """
+        if cents is not None and cents != cents:    # nan
+            cents = None
+        self.cents = cents
+
+    def step(self, dt):
+        """step.
+        Advance the needle and strobe by ``dt`` seconds, touching only
+        the items that changed. Returns False once there is no note and
+        the needle has come to rest, so an idle meter costs nothing.
+        """
+        target = 0.0 if self.cents is None else self.cents
+        self.shown += (target - self.shown) * min(1.0, dt * self.response)
+        if abs(target - self.shown) < 0.05:
+            self.shown = target
+        if self.cents is not None:
+            # one move for the whole row, wrapped by a band spacing
+            self.phase += max(-self.range_cents,
+                              min(self.range_cents, self.cents)) * \
+                self.strobe_speed * dt
+            self.phase %= self.spacing
+            if self.phase != self.strobe_x:
+                self.move('strobe', self.phase - self.strobe_x, 0)
+                self.strobe_x = self.phase
+        drawn = (round(self.shown, 1), self.cents is None,
+                 self.cents is not None and
+                 abs(self.cents) <= self.tuned_cents,
+                 None if self.cents is None else round(self.cents))
+        if drawn != self.drawn:
+            if drawn[0] != (self.drawn or (None,))[0]:
+                self.coords(self.needle, *self.needle_coords(self.shown))
+            if drawn[1:] != (self.drawn or (None, None, None, None))[1:]:
+                silent, tuned, rounded = drawn[1:]
+                color = '#999999' if silent else \
+                    '#2e8b57' if tuned else '#cc3333'
+                self.itemconfigure(self.needle, fill=color)
+                self.itemconfigure('strobe', fill='#cccccc' if silent
+                                   else color)
+                self.itemconfigure(self.readout, text='' if silent
+                                   else '%+d¢' % rounded)
+            self.drawn = drawn
+        return self.cents is not None or self.shown != 0.0
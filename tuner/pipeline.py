@@ -0,0 +1,380 @@
+"""
+Producer/consumer pipeline between the audio callback and pitch detection.
+
+The PortAudio callback only copies each block into a queue; a worker
+thread runs the (slow) analysis and leaves results for the GUI to pick
+up with ``Tk.after`` polling. Each analysed signal (one per input
+channel on a multi-channel interface) has its own ``ChannelTracker``,
+and a ``ChannelPool`` runs them side by side on a thread pool; numpy's
+FFTs and array loops release the GIL, so channels scale across cores.
+"""
+
+__author__ = 'Vedant Mehta'
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import tunertools
+from profiling import PROFILER
+
+# YIN settings for live tracking: a 30 ms window with the lag range kept
+# to half of it, so low E stays in reach without the sub-harmonic errors
+# of a lag range as long as the window, decimated to 11.025 kHz since
+# guitar pitches need no more
+LIVE_YIN_PARAMS = {'wl': 1323, 'ws': 441, 'f0_min': 65, 'target_sr': 11025}
+
+
+class AnalysisPipeline:
+    """
+    Runs ``analyse`` on audio blocks in a worker thread.
+
+    ``feed`` has the signature of a ``sounddevice`` stream callback and
+    can be passed to ``sd.InputStream`` directly. It never blocks: when
+    the queue already holds ``maxsize`` blocks the new block is dropped
+    and counted instead.
+
+    Blocks are copied into a pool of reusable buffers, so a steady
+    stream allocates nothing per callback. ``analyse`` must therefore
+    not keep a reference to the block it is given.
+    """
+
+    def __init__(self, analyse, maxsize=64, profiler=PROFILER):
+        """__init__.
+
+        Parameters
+        ----------
+        analyse : callable
+            called with each 2-D ``(frames, channels)`` block in the worker
+            thread; anything other than None it returns is queued as a result
+        maxsize : int
+            maximum number of blocks waiting for analysis
+        profiler : profiling.Profiler
+            records the 'capture' and 'analyse' stages and the
+            'queue_wait' delay
+        """
+        self.analyse = analyse
+        self.maxsize = maxsize
+        self.profiler = profiler
+        # perf_counter_ns() at the callback that delivered the block behind
+        # the newest result returned by poll()
+        self.last_capture_ns = None
+        # deque.append/popleft are atomic, so the audio thread never waits
+        # on a lock held by the worker
+        self.blocks = deque()
+        self.free = deque()
+        self.results = deque()
+        self.processed_blocks = 0
+        self.dropped_blocks = 0
+        self.overflows = 0
+        self.status_flags = 0
+        self.last_status = ''
+        self.error = None
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """start.
+        Start the worker thread
+        """
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='pytuner-analysis')
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        """stop.
+
+        Parameters
+        ----------
+        timeout : float
+            seconds to wait for the worker to finish its current block
+        """
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.blocks.clear()
+
+    def feed(self, indata, frames=None, time_info=None, status=None):
+        """feed.
+        Producer side, called from the audio thread
+
+        Parameters
+        ----------
+        indata : np.ndarray
+            data from the input stream, copied before queueing
+        frames : int
+            number of frames in ``indata`` (Not Used)
+        time_info : undefined
+            timestamps of the block (Not Used)
+        status : sounddevice.CallbackFlags
+            status of stream
+        """
+        if status:
+            self.status_flags += 1
+            self.last_status = str(status)
+            if getattr(status, 'input_overflow', False):
+                self.overflows += 1
+        if len(self.blocks) >= self.maxsize:
+            self.dropped_blocks += 1
+            return
+        with self.profiler.deferred_stage('capture'):
+            captured = time.perf_counter_ns()
+            try:
+                buf = self.free.pop()
+            except IndexError:
+                buf = None
+            if buf is None or buf.shape != indata.shape or \
+                    buf.dtype != indata.dtype:
+                buf = np.empty_like(indata)
+            np.copyto(buf, indata)
+            self.blocks.append((buf, captured))
+        self._wake.set()
+
+    def poll(self):
+        """poll.
+        Consumer side, returns every result produced since the last call
+        """
+        out = []
+        while self.results:
+            self.last_capture_ns, result = self.results.popleft()
+            out.append(result)
+        return out
+
+    def stats(self):
+        """stats.
+        Returns queue depth and block counters as a dict
+        """
+        return {'queue_depth': len(self.blocks),
+                'processed_blocks': self.processed_blocks,
+                'dropped_blocks': self.dropped_blocks,
+                'overflows': self.overflows,
+                'status_flags': self.status_flags,
+                'last_status': self.last_status}
+
+    def _run(self):
+        while self._running:
+            self._wake.wait()
+            self._wake.clear()
+            # capture timings queued lock-free by feed
+            self.profiler.flush()
+            while self._running and self.blocks:
+                block, captured = self.blocks.popleft()
+                self.profiler.value('queue_wait',
+                                    time.perf_counter_ns() - captured)
+                try:
+                    with self.profiler.stage('analyse'):
+                        result = self.analyse(block)
+                except Exception as e:   # keep the stream alive, report later
+                    self.error = e
+                    continue
+                finally:
+                    self.free.append(block)
+                self.processed_blocks += 1
+                if result is not None:
+                    self.results.append((captured, result))
+
+
+class ChannelTracker:
+    """
+    Analysis state of one input signal: a ``SignalGate``, a YIN
+    ``PitchTracker``, a ``PitchSmoother`` and the stream times of the
+    last escalation and strum.
+    """
+
+    def __init__(self, sr, yin_params=None, max_block=4096, cascade=None,
+                 escalation_window=0.5, strum_window=0.5,
+                 strum_interval=0.25, min_confidence=0.85,
+                 profiler=PROFILER):
+        """__init__.
+
+        Parameters
+        ----------
+        sr : int
+            samplerate
+        yin_params : dict
+            ``PitchTracker`` settings (wl, ws, f0_min, target_sr, ...),
+            ``LIVE_YIN_PARAMS`` by default
+        max_block : int
+            largest block passed to ``process``
+        cascade : tunertools.Cascade
+            detectors escalated to when YIN is not trusted; None never
+            escalates. It holds no state, so channels can share one
+        escalation_window : float
+            seconds of audio given to the cascade, at most once per window
+        strum_window : float
+            seconds of audio analysed per strum
+        strum_interval : float
+            seconds between strum analyses
+        min_confidence : float
+            frames below this confidence are left out of the pitch
+        profiler : profiling.Profiler
+            records the 'gate', 'yin', 'cascade', 'smooth' and 'strum'
+            stages
+        """
+        self.sr = sr
+        self.cascade = cascade
+        self.escalation_window = escalation_window
+        self.strum_window = strum_window
+        self.strum_interval = strum_interval
+        self.profiler = profiler
+        self.tracker = tunertools.PitchTracker(
+            sr, max_block=max_block,
+            history=int(max(escalation_window, strum_window) * sr),
+            **(LIVE_YIN_PARAMS if yin_params is None else yin_params))
+        # detectors only run between a pluck and the note dying away
+        self.gate = tunertools.SignalGate(sr)
+        self.smoother = tunertools.PitchSmoother(
+            min_confidence=min_confidence)
+        self.reset()
+
+    def reset(self):
+        """reset.
+        Forget the buffered audio and the note being tracked
+        """
+        self.tracker.reset()
+        self.smoother.reset()
+        self.signal = False
+        self.last_strum = 0.0
+        # the first window must fill before YAAPT has enough audio
+        self.last_escalation = 0.0
+
+    def process(self, sig, strum=False):
+        """process.
+
+        Parameters
+        ----------
+        sig : np.ndarray
+            1-D block of new samples
+        strum : bool
+            report all six strings of a strum instead of a single note
+
+        Returns ``('note', SmoothedPitch)``, ``('strings',
+        StringDeviations)`` in strum mode, ``('silent', None)`` once when
+        the note has died away, or None when there is nothing new.
+        """
+        with self.profiler.stage('gate'):
+            state = self.gate.update(sig)
+        if not self.gate.open:
+            # silence or noise: skip the detectors, say so once
+            if not self.signal:
+                return None
+            self.signal = False
+            return 'silent', None
+        self.signal = True
+        if state == tunertools.SignalGate.ONSET:
+            # analyse the new note from its pluck, not the old one's tail
+            self.tracker.reset()
+            self.smoother.reset()
+            self.last_strum = self.last_escalation = 0.0
+        # run the cheap detector on the frames completed by this block
+        with self.profiler.stage('yin'):
+            yin, harmonic_rates, argmins, times = self.tracker.push(sig)
+        if len(yin) == 0:
+            return None
+        if strum:
+            return self.strum(times[-1])
+        track = tunertools.PitchTrack(yin, harmonic_rates, times)
+        # escalate to the next stages on the last escalation window of
+        # audio, at most once per window; the slower track covers that
+        # whole window, so it replaces the smoother's history
+        if self.cascade is not None and not self.cascade.accept(track) \
+                and times[-1] - self.last_escalation >= \
+                self.escalation_window:
+            self.last_escalation = times[-1]
+            with self.profiler.stage('cascade'):
+                name, track = self.cascade(
+                    self.tracker.recent(int(self.escalation_window *
+                                            self.sr)),
+                    self.sr, start=1)
+            self.smoother.reset()
+        # carry the pitch and note across frames instead of showing each
+        # frame on its own
+        with self.profiler.stage('smooth'):
+            smoothed = self.smoother.extend(track.pitches,
+                                            track.harmonic_rates)
+        return None if smoothed is None else ('note', smoothed)
+
+    def strum(self, now):
+        """strum.
+        Deviation of all six strings from the last strum window of audio,
+        at most once per strum_interval
+
+        Parameters
+        ----------
+        now : float
+            stream time in seconds of the newest frame
+        """
+        if now - self.last_strum < self.strum_interval or \
+                now < self.strum_window:
+            return None
+        self.last_strum = now
+        chord = self.tracker.recent(int(self.strum_window * self.sr))
+        with self.profiler.stage('strum'):
+            return 'strings', tunertools.string_deviations(chord, self.sr)
+
+
+class ChannelPool:
+    """
+    Runs one ``ChannelTracker`` per signal on a shared thread pool.
+
+    A single tracker is run in the calling thread, so the mono case
+    pays nothing for the pool.
+    """
+
+    def __init__(self, trackers, workers=None):
+        """__init__.
+
+        Parameters
+        ----------
+        trackers : list of ChannelTracker
+            one per signal, in the order ``process`` receives them
+        workers : int
+            pool threads; by default one per tracker, up to the number
+            of CPUs
+        """
+        self.trackers = trackers
+        if workers is None:
+            workers = min(len(trackers), os.cpu_count() or 1)
+        self.executor = ThreadPoolExecutor(
+            workers, thread_name_prefix='pytuner-channel') \
+            if len(trackers) > 1 and workers > 1 else None
+
+    def process(self, signals, strum=False):
+        """process.
+
+        Parameters
+        ----------
+        signals : list of np.ndarray
+            one 1-D block per tracker, e.g. ``AudioEngine.split(indata)``
+        strum : bool
+            passed on to ``ChannelTracker.process``
+
+        Returns the list of per-channel results.
+        """
+        if self.executor is None:
+            return [tracker.process(sig, strum)
+                    for tracker, sig in zip(self.trackers, signals)]
+        futures = [self.executor.submit(tracker.process, sig, strum)
+                   for tracker, sig in zip(self.trackers, signals)]
+        return [future.result() for future in futures]
+
+    def reset(self):
+        """reset.
+        Reset every tracker
+        """
+        for tracker in self.trackers:
+            tracker.reset()
+
+    def close(self):
+        """close.
+        Shut the thread pool down
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
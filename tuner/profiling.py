@@ -0,0 +1,368 @@
+"""
+Low-overhead timing of the tuner pipeline stages.
+
+Profiling is off unless the ``PYTUNER_PROFILE`` environment variable is
+set (to anything but ``0``) or a ``Profiler`` is created with
+``enabled=True``. When off, ``stage`` hands back a shared do-nothing
+context manager. Each stage keeps a histogram of wall time and a
+rough count of the net pymalloc blocks it left behind (see
+``Profiler``). Stages on the audio callback use ``deferred_stage``,
+which takes no lock and leaves the bookkeeping to ``flush`` on another
+thread. Results export as JSON or as a Chrome trace (load it in
+``chrome://tracing`` or Perfetto)::
+
+    PYTUNER_PROFILE=1 PYTUNER_PROFILE_OUT=tuner.trace.json python tuner.py
+"""
+
+__author__ = 'Vedant Mehta'
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+PROFILE_ENV = 'PYTUNER_PROFILE'
+PROFILE_OUT_ENV = 'PYTUNER_PROFILE_OUT'
+
+
+class Histogram:
+    """
+    Power-of-two bucketed histogram of non-negative integers.
+
+    Bucket ``i`` counts values in ``[2 ** (i - 1), 2 ** i)`` (bucket 0
+    holds zero), so recording is O(1) and memory is fixed.
+    """
+
+    def __init__(self, n_buckets=40):
+        """__init__.
+
+        Parameters
+        ----------
+        n_buckets : int
+            number of buckets; larger values land in the last one
+        """
+        self.buckets = [0] * n_buckets
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        """add.
+
+        Parameters
+        ----------
+        value : int
+            value to record, negative values count as zero
+        """
+        value = max(int(value), 0)
+        self.buckets[min(value.bit_length(), len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """percentile.
+
+        Parameters
+        ----------
+        q : float
+            percentile in [0, 100]
+
+        Returns the upper edge of the bucket holding the percentile.
+        """
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(2 ** i - 1, self.max)
+        return self.max
+
+    def summary(self, scale=1.0):
+        """summary.
+
+        Parameters
+        ----------
+        scale : float
+            factor applied to every reported value (e.g. ns to ms)
+        """
+        if not self.count:
+            return {'count': 0}
+        return {'count': self.count,
+                'mean': self.total / self.count * scale,
+                'min': self.min * scale,
+                'p50': self.percentile(50) * scale,
+                'p90': self.percentile(90) * scale,
+                'p99': self.percentile(99) * scale,
+                'max': self.max * scale,
+                'buckets': self.buckets}
+
+
+class NetCount:
+    """
+    Count, total, min and max of signed integers, e.g. net block counts.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        """add.
+
+        Parameters
+        ----------
+        value : int
+            value to record, may be negative
+        """
+        value = int(value)
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def summary(self):
+        """summary.
+        Returns the count, mean, min and max as a dict
+        """
+        if not self.count:
+            return {'count': 0}
+        return {'count': self.count, 'mean': self.total / self.count,
+                'min': self.min, 'max': self.max}
+
+
+class Profiler:
+    """
+    Per-stage wall time histograms, net pymalloc block counts and a
+    bounded log of trace events.
+
+    The block count is ``sys.getallocatedblocks()`` after a stage minus
+    before it, so it is only a hint at a stage's garbage: the counter is
+    process-wide (stages running on other threads at the same time are
+    counted too), a stage that allocates and frees as much nets zero,
+    and numpy data buffers, which are not pymalloc blocks, are not
+    counted at all. ``benchmark.py alloc`` measures allocation with
+    ``tracemalloc`` instead.
+    """
+
+    def __init__(self, enabled=None, allocations=True, max_events=100000):
+        """__init__.
+
+        Parameters
+        ----------
+        enabled : bool
+            record stages; None reads ``PYTUNER_PROFILE``
+        allocations : bool
+            also record each stage's net pymalloc blocks
+            (``sys.getallocatedblocks``), see above
+        max_events : int
+            trace events kept for the Chrome trace, oldest dropped first
+        """
+        if enabled is None:
+            enabled = os.environ.get(PROFILE_ENV, '0') not in ('', '0')
+        self.enabled = enabled
+        self.allocations = allocations
+        self.times = {}
+        self.allocs = {}
+        self.values = {}
+        # exponential moving averages, for live displays
+        self.recent = {}
+        self.events = deque(maxlen=max_events)
+        # (name, duration, blocks, start, thread) from deferred_stage,
+        # waiting for flush; deque appends need no lock
+        self.deferred = deque(maxlen=max_events)
+        self.lock = threading.Lock()
+        self.start_ns = time.perf_counter_ns()
+        self._null = nullcontext()
+
+    def stage(self, name):
+        """stage.
+
+        Parameters
+        ----------
+        name : str
+            pipeline stage, e.g. 'yin'
+
+        Returns a context manager timing the code inside it.
+        """
+        if not self.enabled:
+            return self._null
+        return self._stage(name)
+
+    def deferred_stage(self, name):
+        """deferred_stage.
+        Like ``stage``, but never waits for ``lock``: the timing is
+        queued and only added to the histograms by ``flush``. Meant for
+        the audio callback.
+
+        Parameters
+        ----------
+        name : str
+            pipeline stage, e.g. 'capture'
+        """
+        if not self.enabled:
+            return self._null
+        return self._stage(name, deferred=True)
+
+    @contextmanager
+    def _stage(self, name, deferred=False):
+        blocks = sys.getallocatedblocks() if self.allocations else 0
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            blocks = sys.getallocatedblocks() - blocks \
+                if self.allocations else None
+            if deferred:
+                self.deferred.append((name, end - start, blocks, start,
+                                      threading.get_ident()))
+            else:
+                self.record(name, end - start, blocks, start)
+
+    def flush(self):
+        """flush.
+        Record the stages queued by ``deferred_stage``; called by the
+        pipeline worker, and before every summary or trace
+        """
+        while True:
+            try:
+                entry = self.deferred.popleft()
+            except IndexError:
+                return
+            self.record(*entry)
+
+    def record(self, name, duration_ns, blocks=None, start_ns=None,
+               thread=None):
+        """record.
+
+        Parameters
+        ----------
+        name : str
+            pipeline stage
+        duration_ns : int
+            wall time in nanoseconds
+        blocks : int
+            net pymalloc blocks, if known
+        start_ns : int
+            ``time.perf_counter_ns()`` at the start, for the trace
+        thread : int
+            ``threading.get_ident()`` of the thread that ran the stage,
+            by default the calling one
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            if name not in self.times:
+                self.times[name] = Histogram()
+                self.allocs[name] = NetCount()
+            self.times[name].add(duration_ns)
+            self._smooth(name, duration_ns)
+            if blocks is not None:
+                self.allocs[name].add(blocks)
+            if start_ns is None:
+                start_ns = time.perf_counter_ns() - duration_ns
+            self.events.append((name, start_ns, duration_ns,
+                                thread or threading.get_ident()))
+
+    def value(self, name, value):
+        """value.
+        Record a measurement that is not a stage, e.g. a delay in ns
+
+        Parameters
+        ----------
+        name : str
+            name of the measurement
+        value : int
+            value to record
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.values.setdefault(name, Histogram()).add(value)
+            self._smooth(name, value)
+
+    def _smooth(self, name, value, alpha=0.1):
+        prev = self.recent.get(name)
+        self.recent[name] = value if prev is None else \
+            prev + alpha * (value - prev)
+
+    def recent_ms(self, name):
+        """recent_ms.
+        Moving average of a stage time (or ns measurement) in ms, or None
+
+        Parameters
+        ----------
+        name : str
+            stage or measurement name
+        """
+        value = self.recent.get(name)
+        return None if value is None else value / 1e6
+
+    def summary(self):
+        """summary.
+        Returns every histogram as a JSON-ready dict, times in ms
+        """
+        self.flush()
+        with self.lock:
+            return {'stages': {name: {'ms': self.times[name].summary(1e-6),
+                                      'net_pymalloc_blocks':
+                                      self.allocs[name].summary()}
+                               for name in self.times},
+                    'values_ms': {name: h.summary(1e-6)
+                                  for name, h in self.values.items()}}
+
+    def chrome_trace(self):
+        """chrome_trace.
+        Returns the recorded events in Chrome trace event format
+        """
+        self.flush()
+        with self.lock:
+            events = list(self.events)
+        pid = os.getpid()
+        return {'traceEvents': [
+            {'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+             'ts': (start - self.start_ns) / 1e3, 'dur': duration / 1e3}
+            for name, start, duration, tid in events],
+            'displayTimeUnit': 'ms'}
+
+    def export(self, path, fmt=None):
+        """export.
+
+        Parameters
+        ----------
+        path : str
+            output file
+        fmt : str
+            'json' for the histogram summary or 'chrome' for the trace;
+            by default 'chrome' when ``path`` ends in '.trace.json'
+        """
+        if fmt is None:
+            fmt = 'chrome' if path.endswith('.trace.json') else 'json'
+        data = self.chrome_trace() if fmt == 'chrome' else self.summary()
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+    def reset(self):
+        """reset.
+        Forget everything recorded so far
+        """
+        with self.lock:
+            self.times.clear()
+            self.allocs.clear()
+            self.values.clear()
+            self.recent.clear()
+            self.events.clear()
+            self.deferred.clear()
+
+
+PROFILER = Profiler()
@@ -0,0 +1,57 @@
+"""
+Tests for ``trackcache``.
+
+Run from the ``tuner`` directory::
+
+    python -m unittest test_trackcache
+"""
+
+__author__ = 'Vedant Mehta'
+
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import trackcache
+import tunertools
+
+
+class TrackCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='pytuner-cache-test-')
+        self.cache = trackcache.TrackCache(self.directory)
+        self.sig = tunertools.synthetic_note(110.0, seconds=0.25)
+        self.backend = tunertools.FFT_BACKEND
+
+    def tearDown(self):
+        tunertools.FFT_BACKEND = self.backend
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_hit(self):
+        first = self.cache.compute('yin', self.sig, 44100)
+        second = self.cache.compute('yin', self.sig, 44100)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        np.testing.assert_array_equal(first.pitches, second.pitches)
+
+    def test_precision_is_part_of_the_key(self):
+        tunertools.FFT_BACKEND = tunertools.FFTBackend(precision='float64')
+        self.cache.compute('yin', self.sig, 44100)
+        tunertools.FFT_BACKEND = tunertools.FFTBackend(precision='float32')
+        track = self.cache.compute('yin', self.sig, 44100)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(self.cache.misses, 2)
+        fresh = tunertools.yin_detector(self.sig, 44100)
+        np.testing.assert_array_equal(track.pitches, fresh.pitches)
+
+    def test_shared_rescans_other_writers(self):
+        cache = trackcache.shared(self.directory, rescan_seconds=0.0)
+        self.assertIs(trackcache.shared(self.directory), cache)
+        cache.compute('yin', self.sig, 44100)
+        self.cache.compute('yin', self.sig, 22050)
+        cache.compute('yin', self.sig, 11025)
+        self.assertEqual(cache.total_bytes, cache.size())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,320 @@
+"""
+Persistent on-disk cache of pitch tracks.
+
+A track is keyed by a hash of the audio samples, the samplerate, the
+detector name and its parameters (defaults included, so ``wl=882`` and
+leaving ``wl`` out share an entry), and the settings of
+``tunertools.FFT_BACKEND`` that change results (precision and FFT
+module). Each entry is one ``.npy`` file
+holding the ``(3, frames)`` array of pitches, harmonic rates and times,
+which is memory-mapped when read back. The directory is kept under a
+size bound by evicting the least recently used entries.
+
+Several processes may share a directory: entries are written to a
+temporary file and renamed into place, a reader only ever sees complete
+files, and an entry removed by another process is simply a miss::
+
+    cache = TrackCache()
+    track = cache.compute('yin', sig, sr, wl=1323, ws=441)
+
+The directory is ``PYTUNER_CACHE`` if set, else ``pytuner/tracks``
+under the user cache directory (``XDG_CACHE_HOME`` or ``~/.cache``).
+"""
+
+__author__ = 'Vedant Mehta'
+
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import tunertools
+
+CACHE_ENV = 'PYTUNER_CACHE'
+# bump when the stored layout or a detector's output changes
+VERSION = 2
+SUFFIX = '.npy'
+# share of max_bytes that put evicts down to once it is exceeded
+LOW_WATER = 0.9
+
+
+def default_directory():
+    """cache directory from ``PYTUNER_CACHE`` or the user cache directory"""
+    directory = os.environ.get(CACHE_ENV)
+    if directory:
+        return directory
+    base = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pytuner', 'tracks')
+
+
+class TrackCache:
+    """
+    Size-bounded LRU cache of ``tunertools.PitchTrack`` results on disk.
+
+    Recency is the entry's modification time, which ``get`` refreshes,
+    so it is shared by every process using the directory without any
+    index file or lock.
+
+    ``put`` keeps a running total of the directory size, updated by
+    each write, and only lists the directory to evict when that total
+    goes over ``max_bytes`` (evicting down to ``LOW_WATER`` of it). The
+    total is rescanned at most every ``rescan_seconds``, which picks up
+    what other processes wrote meanwhile, so processes sharing the
+    directory keep it near ``max_bytes`` between them. Build one
+    instance per process and directory (see ``shared``), or every
+    instance starts with a scan.
+    """
+
+    def __init__(self, directory=None, max_bytes=256 * 2 ** 20,
+                 stale_seconds=3600.0, rescan_seconds=10.0):
+        """__init__.
+
+        Parameters
+        ----------
+        directory : str
+            where entries are stored, ``default_directory()`` by default
+        max_bytes : int
+            total size of the entries kept; None never evicts
+        stale_seconds : float
+            age after which a temporary file left by a crashed writer is
+            removed
+        rescan_seconds : float
+            age after which ``put`` rescans the directory size instead
+            of trusting its running total
+        """
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+        self.rescan_seconds = rescan_seconds
+        self.hits = self.misses = 0
+        # bytes in the directory as far as this instance knows, None
+        # until the first scan, and time.monotonic() of that scan
+        self.total_bytes = None
+        self.scanned_at = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, detector, sig, sr, params=None):
+        """key.
+
+        Parameters
+        ----------
+        detector : str
+            name in ``tunertools.DETECTORS``
+        sig : np.ndarray
+            the audio analysed
+        sr : int
+            samplerate
+        params : dict
+            keyword arguments for the detector
+
+        Returns the hex digest naming the entry.
+        """
+        func = tunertools.get_detector(detector)
+        backend = tunertools.FFT_BACKEND
+        # float32 and float64 runs (or np.fft and scipy.fft) differ
+        fft = [backend.precision, backend.module().__name__]
+        bound = inspect.signature(func).bind(sig, sr, **(params or {}))
+        bound.apply_defaults()
+        settings = {k: v for k, v in bound.arguments.items()
+                    if k not in ('sig', 'sr')}
+        sig = np.ascontiguousarray(sig)
+        h = hashlib.blake2b(digest_size=20)
+        h.update(json.dumps([VERSION, detector, int(sr), str(sig.dtype),
+                             sig.shape, settings, fft], sort_keys=True,
+                            default=str).encode())
+        h.update(sig.view(np.uint8).data)
+        return h.hexdigest()
+
+    def path(self, key):
+        """path.
+        File of the entry ``key``
+        """
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key, mmap=True):
+        """get.
+
+        Parameters
+        ----------
+        key : str
+            result of ``key``
+        mmap : bool
+            memory-map the entry (read-only) instead of reading it
+
+        Returns the cached ``PitchTrack``, or None on a miss.
+        """
+        path = self.path(key)
+        try:
+            data = np.load(path, mmap_mode='r' if mmap else None)
+        except (OSError, ValueError):
+            # missing, evicted meanwhile or unreadable
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)      # mark as recently used
+        except OSError:
+            pass
+        self.hits += 1
+        return tunertools.PitchTrack(data[0], data[1], data[2])
+
+    def put(self, key, track):
+        """put.
+
+        Parameters
+        ----------
+        key : str
+            result of ``key``
+        track : tunertools.PitchTrack
+            result to store
+        """
+        data = np.array([track.pitches, track.harmonic_rates, track.times],
+                        np.float64).reshape(3, -1)
+        now = time.monotonic()
+        if self.total_bytes is None or \
+                now - self.scanned_at > self.rescan_seconds:
+            self.total_bytes = self.size()
+            self.scanned_at = now
+        path = self.path(key)
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, data)
+                written = f.tell()
+            # atomic: readers see the old entry, no entry or the new one
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self.total_bytes += written - replaced
+        if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+            # leave some room, so a full cache is not rescanned per put
+            self.evict(int(self.max_bytes * LOW_WATER))
+
+    def compute(self, detector, sig, sr, **params):
+        """compute.
+
+        Parameters
+        ----------
+        detector : str
+            name in ``tunertools.DETECTORS``
+        sig : np.ndarray
+            numpy array of audio
+        sr : int
+            samplerate
+        params :
+            keyword arguments for the detector
+
+        Returns the cached track, running and storing the detector on a
+        miss.
+        """
+        key = self.key(detector, sig, sr, params)
+        track = self.get(key)
+        if track is None:
+            track = tunertools.get_detector(detector)(sig, sr, **params)
+            self.put(key, track)
+        return track
+
+    def entries(self):
+        """entries.
+        ``(mtime, size, path)`` of every entry, oldest first
+        """
+        found = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(SUFFIX):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                found.append((st.st_mtime, st.st_size, entry.path))
+        found.sort()
+        return found
+
+    def size(self):
+        """size.
+        Total bytes of the entries
+        """
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_bytes):
+        """evict.
+
+        Parameters
+        ----------
+        max_bytes : int
+            remove least recently used entries until the rest fit
+
+        Also removes stale temporary files. Returns the number of
+        entries removed.
+        """
+        now = time.time()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp'):
+                    try:
+                        if now - entry.stat().st_mtime > self.stale_seconds:
+                            os.remove(entry.path)
+                    except OSError:
+                        pass
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass            # another process evicted it first
+            except OSError:
+                continue        # still mapped elsewhere (Windows)
+            total -= size
+        self.total_bytes = total
+        self.scanned_at = time.monotonic()
+        return removed
+
+    def clear(self):
+        """clear.
+        Remove every entry
+        """
+        return self.evict(0)
+
+    def stats(self):
+        """stats.
+        Hits, misses, entries and bytes as a dict
+        """
+        entries = self.entries()
+        return {'directory': self.directory, 'hits': self.hits,
+                'misses': self.misses, 'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries)}
+
+
+# per-process instances for ``shared``, keyed by process and directory
+_SHARED = {}
+
+
+def shared(directory=None, **kwargs):
+    """
+    The ``TrackCache`` of ``directory`` for this process, built on first
+    use with ``kwargs``, so repeated lookups (e.g. one per file in a
+    worker process) keep one running size total instead of rescanning
+    the directory each time.
+    """
+    directory = directory or default_directory()
+    key = (os.getpid(), os.path.abspath(directory))
+    cache = _SHARED.get(key)
+    if cache is None:
+        cache = _SHARED[key] = TrackCache(directory, **kwargs)
+    return cache
@@ -7,12 +7,18 @@ Creates a ``Tuner()``object and runs ``Tuner().mainloop()``
 __author__ = 'Vedant Mehta'
 
 import os
+import sys
+import threading
+import time
 import tkinter as tk
 from tkinter import ttk, Tk
 from tkinter.ttk import Style
-import sounddevice as sd
 import tunertools
 from dropdown import LabelDropdown
+from meter import CentsMeter, FrameRenderer
+from pipeline import AnalysisPipeline, ChannelPool, ChannelTracker, \
+    LIVE_YIN_PARAMS
+from profiling import PROFILER, PROFILE_OUT_ENV
 
 
 class AboutDialog(tk.Toplevel):
@@ -71,16 +77,23 @@ class CustomPlayButton(ttk.Button):
     """CustomPlayButton.
     """
 
-    def play_sound_file_path(self, file_path):
+    def play_sound_file_path(self, file_path, bank=None, device=None):
         """play_sound_file_path.
 
         Parameters
         ----------
         file_path : str
             path to audio file
+        bank : tunertools.SampleBank
+            cache holding the decoded file, so a click does no disk I/O
+        device : int or str
+            output device, None for the default one
         """
         self.file_path = file_path
-        self['command'] = lambda: tunertools.play(self.file_path)
+        self.bank = bank
+        self.device = device
+        self['command'] = lambda: tunertools.play(self.file_path, self.bank,
+                                                  self.device)
         """callback function for the InputStream
 
         Parameters
@@ -111,15 +124,14 @@ class Tuner(Tk):
         self.minsize(640, 480)
         self.maxsize(640, 480)
         self.background = tk.Label(self)
-        filepath = os.path.abspath(__file__)
-        dirpath = os.path.dirname(filepath)
-        img_path = os.path.join(
-            dirpath, 'images/neck_cropped_enhanced_resized.png')
-        self.background.image = tk.PhotoImage(file=img_path)
-        self.background['image'] = self.background.image
         self.background.place(x=0, y=0, relwidth=1, relheight=1,)
         self.style = Style()
         self.style_init()
+        # devices, rate, block size and channels; set PYTUNER_INPUT to e.g.
+        # "file:GuitarNotes/A2.wav" or "synthetic:110" to run without one
+        self.engine = tunertools.AudioEngine(blocksize=512, latency='low')
+        # filled in by load_assets once the window is up
+        self.sample_bank = None
         self.create_note_widgets()
         self.create_tuner_widgets()
         self.create_about_dialog_widget()
@@ -129,8 +141,71 @@ class Tuner(Tk):
 
         self.recording = self.previously_recording = False
         self.rec = None
+        # the input device's native rate, set by create_stream
+        self.samplerate = None
+        # YIN settings for the live tracker
+        self.yin_params = dict(LIVE_YIN_PARAMS)
+        # YAAPT is only run when the cheap YIN estimate is not trusted
+        self.cascade = tunertools.Cascade(('yin', 'yaapt'))
+        self.escalation_window = 0.5
+        # frames below min_confidence are left out of the smoothed
+        # pitch; a note within tuned_cents of its target counts as tuned
+        self.min_confidence = 0.85
+        self.tuned_cents = 5
+        # strum mode: all six strings from one chord, every strum_interval
+        self.strum_mode = False
+        self.strum_window = 0.5
+        self.strum_interval = 0.25
+        self.pipeline = None
+        # results are drawn at most once per display frame, however
+        # fast the detector produces them
+        self.renderer = FrameRenderer(self, fps=60)
         self.note_label = ttk.Label(self, style='Tuned.TLabel')
         self.note_label.place(relx=.11, rely=.13, anchor='center')
+        self.meter = CentsMeter(self, width=300, height=120,
+                                tuned_cents=self.tuned_cents)
+        self.meter.place(x=170, y=300)
+        if PROFILER.enabled:
+            # the free column left of the meter; the dropdown, when
+            # open, is drawn over it
+            self.profile_label = ttk.Label(self, style='Profile.TLabel')
+            self.profile_label.place(x=5, y=300)
+            self.profile_label.lower(self.dropdown)
+
+        # the window is drawn before any of the slow start-up work: the
+        # background image is decoded on the first idle turn, and the
+        # reference notes and detector backends load in a thread
+        self.after_idle(self.load_background)
+        self.assets = threading.Thread(target=self.load_assets, daemon=True,
+                                       name='pytuner-assets')
+        self.assets.start()
+
+    def load_background(self):
+        """load_background.
+        Decode the background image and show it behind the widgets
+        """
+        img_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'images/neck_cropped_enhanced_resized.png')
+        self.background.image = tk.PhotoImage(file=img_path)
+        self.background['image'] = self.background.image
+
+    def load_assets(self):
+        """load_assets.
+        Decode the reference notes and warm up the detectors; runs in a
+        background thread. Until it is done, note buttons read their
+        files from disk and the first analysis imports its backends.
+        Failures are printed to stderr and leave that on-demand path.
+        """
+        try:
+            bank = tunertools.SampleBank(self.engine.output_samplerate())
+            for button in self.button_list:
+                button.bank = bank
+            self.sample_bank = bank
+            bank.preload(b.file_path for b in self.button_list)
+            tunertools.warm_up(self.cascade.stages,
+                               target_sr=self.yin_params.get('target_sr'))
+        except Exception as e:
+            print('loading assets failed: %r' % e, file=sys.stderr)
 
     def style_init(self):
         """style_init.
@@ -160,26 +235,50 @@ class Tuner(Tk):
         
         self.style.configure('NotTuned.TLabel', font='Futura 16',
                              foreground='red', background='white')
+        self.style.configure('NoSignal.TLabel', font='Futura 16',
+                             foreground='grey', background='white')
         # title label
         self.style.configure('Title.TLabel', font='Futura 48',
                              foreground='black', background='white')
+        # profiling overlay
+        self.style.configure('Profile.TLabel', font='Courier 9',
+                             foreground='black', background='white')
 
     def create_stream(self):
         """
-        create_stream is a function that creates an input stream for sound data from the main Microphone.
-        Uses sounddevice library InputStream class to record data
+        create_stream is a function that creates an input stream for sound data from the input device of self.engine.
+        Uses sounddevice InputStream class (or a virtual input) to record data
         """
         if self.rec is not None:
             self.rec.close()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.channel_pool.close()
         self.on_rec()
-        self.rec = sd.InputStream(samplerate=44100, device='Microphone',
-                                  callback=self.callback, blocksize=4 * 44100)
+        self.samplerate = self.engine.input_samplerate()
+        # one tracker per analysed signal, see AudioEngine.separate
+        self.channel_pool = ChannelPool([
+            ChannelTracker(self.samplerate, self.yin_params,
+                           max_block=self.engine.blocksize,
+                           cascade=self.cascade,
+                           escalation_window=self.escalation_window,
+                           strum_window=self.strum_window,
+                           strum_interval=self.strum_interval,
+                           min_confidence=self.min_confidence)
+            for _ in range(self.engine.n_signals())])
+        self.channel_text = [''] * len(self.channel_pool.trackers)
+        self.pipeline = AnalysisPipeline(self.analyse)
+        self.pipeline.start()
+        self.rec = self.engine.open_input(self.callback)
         self.rec.start()
+        self.renderer.animate(self.poll_results)
 
     def callback(self, indata, frames, time, status):
         """
         Function for internal use by
-        sd.InputStream (self.rec)
+        sd.InputStream (self.rec). Runs on the audio thread, so it only
+        hands the block to ``self.pipeline``; detection happens in
+        ``analyse`` on the worker thread.
 
         Parameters
         ----------
@@ -188,36 +287,112 @@ class Tuner(Tk):
         indata np.ndarray:
             data from self.rec for pitch determination
         frames int:
-            samplerate of audio input (Not Directly Used)
+            number of frames in indata (Not Used)
         time undefined:
             time for execution (Not Used)
-        status undefined:
-            status of stream (Not Used)
+        status sounddevice.CallbackFlags:
+            status of stream, counted by the pipeline
 
         """
-        # get data
         if self.recording:
-            data = indata.copy()
-        # run pitch detection algorithms
-        self.yin, *others = tunertools.YIN([i for j in data for i in j], 44100)
-        del others
-        self.YAAPT = tunertools.yaapt([i for j in data for i in j])
-        # set the pitch
-        self.pitch = tunertools.avg_pitch(self.YAAPT.samp_values)
-        # Get the list of possible notes
-        self.noteslist = dict(tunertools.notes())
-        # Round the pitch to the nearest note
-        self.note = tunertools.quantize(self.pitch,
-                                        list(self.noteslist.values()))
-        # Map the notes
-        self.label = {v: k for (k, v) in self.noteslist.items()}[self.note]
+            self.pipeline.feed(indata, frames, time, status)
+
+    def analyse(self, data):
+        """
+        Pitch detection for one block, run on the pipeline worker thread.
+
+        Parameters
+        ----------
+        data np.ndarray:
+            block copied from self.rec
+
+        Returns ``('note', text, style, cents)`` for ``update_labels``
+        (one line per channel, and no meter, when ``self.engine``
+        separates them),
+        ``('strings', deviations)`` for ``update_strings`` in strum mode,
+        or None when there is nothing new to show.
+        """
+        results = self.channel_pool.process(self.engine.split(data),
+                                            self.strum_mode)
+        if len(results) == 1:
+            kind, value = results[0] or (None, None)
+            if kind == 'silent':
+                if self.strum_mode:
+                    return 'strings', None
+                return 'note', 'No signal', 'NoSignal.TLabel', None
+            if kind == 'strings':
+                return kind, value
+            if kind == 'note':
+                return 'note', self.note_text(value), \
+                    self.note_style(value), value.cents
+            return None
+        # several instruments: one line per channel, strum mode reads
+        # the first channel
+        if self.strum_mode:
+            return results[0] if results[0] and \
+                results[0][0] == 'strings' else None
+        if not any(results):
+            return None
+        for i, result in enumerate(results):
+            if result is not None:
+                kind, value = result
+                self.channel_text[i] = self.note_text(value) \
+                    if kind == 'note' else ''
+        text = '\n'.join('%d: %s' % (i + 1, text or 'No signal')
+                         for i, text in enumerate(self.channel_text))
+        return 'note', text, 'Tuned.TLabel', None
+
+    def note_text(self, smoothed):
+        """note_text.
+        Label text for a ``tunertools.SmoothedPitch``
+        """
+        return smoothed.label + ' ' + str(round(smoothed.pitch, ndigits=2))
+
+    def note_style(self, smoothed):
+        """note_style.
+        Label style for a ``tunertools.SmoothedPitch``
+        """
         # Update the style on label
-        if abs(self.pitch - self.note) <= 1:
-            self.update_labels(
-                self.label + ' ' + str(round(self.pitch, ndigits=2)), 'Tuned.TLabel')
-        else:
-            self.update_labels(
-                self.label + ' ' + str(round(self.pitch, ndigits=2)), 'NotTuned.TLabel')
+        if abs(smoothed.cents) <= self.tuned_cents:
+            return 'Tuned.TLabel'
+        return 'NotTuned.TLabel'
+
+    def poll_results(self, dt):
+        """
+        Hand the newest pipeline result to ``self.renderer``; run by it
+        once per frame while recording, so Tk is only touched from this
+        thread and results arriving faster than the frame rate are
+        skipped rather than drawn.
+
+        Parameters
+        ----------
+        dt float:
+            seconds since the previous frame (Not Used)
+
+        Returns whether to keep polling.
+        """
+        if self.rec is None:
+            return False
+        results = self.pipeline.poll()
+        if results:
+            self.renderer.submit('result', self.show_result, results[-1])
+        if PROFILER.enabled:
+            self.update_profile_overlay()
+        return True
+
+    def show_result(self, result):
+        """show_result.
+        Draw one result of ``analyse``
+        """
+        kind, *payload = result
+        with PROFILER.stage('gui'):
+            if kind == 'strings':
+                self.update_strings(*payload)
+            else:
+                self.update_labels(*payload)
+        PROFILER.value('audio_to_display',
+                       time.perf_counter_ns() -
+                       self.pipeline.last_capture_ns)
 
     def on_stop(self):
         """on_stop.
@@ -229,6 +404,9 @@ class Tuner(Tk):
         self.rec.stop()
         self.rec.close()
         self.rec = None
+        self.pipeline.stop()
+        self.channel_pool.close()
+        self.renderer.stop_animation(self.poll_results)
         self.rec_button['command'] = self.create_stream
         self.update_labels('', 'Tuned.TLabel')
         self.rec_button['text'] = 'Start Tuning'
@@ -241,15 +419,78 @@ class Tuner(Tk):
         self.rec_button['text'] = 'Stop Tuning'
         self.rec_button['command'] = self.on_stop
 
-    def update_labels(self, label, style):
-        self.note_label['text'] = label
-        self.note_label['style'] = style
+    def update_labels(self, label, style, cents=None):
+        """update_labels.
+        Show the note and its deviation, configuring only what changed
+
+        Parameters
+        ----------
+        label : str
+            note text
+        style : str
+            ttk style of the note label
+        cents : float
+            deviation for the meter, None to park it
+        """
+        if self.note_label['text'] != label:
+            self.note_label['text'] = label
+        if str(self.note_label['style']) != style:
+            self.note_label['style'] = style
+        self.meter.set(cents)
+        self.renderer.animate(self.meter.step)
+
+    def update_profile_overlay(self):
+        """update_profile_overlay.
+        Show recent stage timings and pipeline counters in the window
+        """
+        def ms(name):
+            value = PROFILER.recent_ms(name)
+            return '-' if value is None else '%.2f' % value
+
+        stats = self.pipeline.stats()
+        # one short line each, to fit the column left of the meter
+        lines = ['%-8s %s ms' % (label, ms(name)) for label, name in (
+            ('analyse', 'analyse'), ('gate', 'gate'), ('yin', 'yin'),
+            ('cascade', 'cascade'), ('capture', 'capture'),
+            ('wait', 'queue_wait'), ('display', 'audio_to_display'))]
+        lines.append('queue %d  drop %d' % (stats['queue_depth'],
+                                            stats['dropped_blocks']))
+        lines.append('overflows %d' % stats['overflows'])
+        self.profile_label['text'] = '\n'.join(lines)
+
+    def update_strings(self, deviations=None):
+        """update_strings.
+        Show each string's deviation in cents on its note button
+
+        Parameters
+        ----------
+        deviations : tunertools.StringDeviations
+            result of ``string_deviations``; None restores the plain labels
+        """
+        for i, button in enumerate(self.button_list):
+            text = self.string_labels[i]
+            if deviations is not None and deviations.cents[i] == \
+                    deviations.cents[i]:     # not nan: the string sounded
+                text += ' %+.0f¢' % deviations.cents[i]
+            if button['text'] != text:
+                button['text'] = text
+
+    def toggle_strum_mode(self):
+        """toggle_strum_mode.
+        Switch between single-note tuning and all strings at once
+        """
+        self.strum_mode = not self.strum_mode
+        self.strum_button['text'] = 'Strum Mode: ' + \
+            ('On' if self.strum_mode else 'Off')
+        self.update_labels('', 'Tuned.TLabel')
+        self.update_strings()
 
     def create_note_widgets(self):
         """create_note_widgets.
         """
         notes = ['Elo', 'A', 'D', 'G', 'B', 'Ehi']
         label_text = ['E2', 'A2', 'D3', 'G3', 'B3', 'E4']
+        self.string_labels = label_text
         pos_label = [(175, 260), (175, 205), (175, 140),
                      (470, 140), (470, 205), (470, 260)]
         self.button_list = []
@@ -260,7 +501,8 @@ class Tuner(Tk):
                                                      style='Note.TButton'))
             self.button_list[pos]['text'] = label_text[pos]
             self.button_list[pos].play_sound_file_path(f'GuitarNotes/\
-                                        {notes[pos]}0.wav'.replace(" ", ""))
+                                        {notes[pos]}0.wav'.replace(" ", ""),
+                self.sample_bank, self.engine.output_device)
             self.button_list[pos].place(
                 x=pos_label[pos][0], y=pos_label[pos][1])
 
@@ -271,6 +513,10 @@ class Tuner(Tk):
         self.rec_button['text'] = 'Start Tuning'
         self.rec_button['command'] = self.create_stream
         self.rec_button.place(x=20, y=10)
+        self.strum_button = ttk.Button(self, text='Strum Mode: Off',
+                                       style='Rec.TButton',
+                                       command=self.toggle_strum_mode)
+        self.strum_button.place(x=420, y=430)
 
     def create_about_dialog(self):
         """create_about_dialog.
@@ -312,6 +558,9 @@ def main():
     """Create and Display Tuner() class"""
     root = Tuner()
     root.mainloop()
+    out = os.environ.get(PROFILE_OUT_ENV)
+    if PROFILER.enabled and out:
+        PROFILER.export(out)
 
 
 if __name__ == '__main__':